@@ -1,4 +1,4 @@
-from flask import Flask, redirect, url_for, render_template, request
+from flask import Flask, redirect, url_for, render_template, request, jsonify
 from flask_login import LoginManager, login_required, current_user, UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from views.index_views import index
@@ -7,6 +7,7 @@ from views.group_views import group
 from views.stats_views import stats
 from views.maintenance_views import maintenance
 from views.health_views import health
+from views.job_views import jobs
 from config import app_config
 
 
@@ -45,6 +46,13 @@ if app.config.get('LOG_TO_FILE'):
 
 app.logger.setLevel(logging.INFO)
 
+# Latency, query counts and Server-Timing for every request (first, so it times the login check too)
+from request_timing import init_request_timing
+init_request_timing(app)
+# Query shapes, latency and EXPLAIN of slow queries for the maintenance page (QUERY_PROFILER=true)
+from query_profiler import init_query_profiler
+init_query_profiler()
+
 # Authentication and user management routes (must be after app is defined)
 from flask import render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
@@ -125,9 +133,23 @@ app.register_blueprint(group, url_prefix='/group')
 app.register_blueprint(stats, url_prefix='/stats')
 app.register_blueprint(maintenance, url_prefix='/maintenance')
 app.register_blueprint(health)
+app.register_blueprint(jobs, url_prefix='/jobs')
 
 # Initialize database connection pool
-from db_connection import init_connection_pool
+from db_connection import init_connection_pool, release_request_connections, DatabaseUnavailable, db_breaker
+# Each request checks out at most one connection, returned to the pool here
+app.teardown_appcontext(release_request_connections)
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    """Answer at once with 503 while the database circuit breaker is open."""
+    if request.accept_mimetypes.best == 'application/json' or request.is_json:
+        response = jsonify({"error": str(e)})
+    else:
+        response = app.response_class(f"The database is temporarily unavailable. {e}", mimetype='text/plain')
+    response.status_code = 503
+    response.headers['Retry-After'] = str(db_breaker.reset_timeout)
+    return response
 try:
     init_connection_pool()
     print("✅ App database connection pool initialized")
@@ -135,6 +157,10 @@ except Exception as e:
     print(f"❌ Failed to initialize database pool: {e}")
     # Don't exit - let app start and handle connection errors gracefully
 
+# Background job workers for long-running actions (vendor refresh, restore, ...)
+from jobs import start_job_workers
+start_job_workers(app)
+
 @app.route('/user_list')
 def legacy_user_list():
     return redirect(url_for('user.user_list'))
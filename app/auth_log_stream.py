@@ -0,0 +1,95 @@
+"""
+Fan-out of new auth_logs rows to Server-Sent Events subscribers.
+
+Each gunicorn worker runs at most one poller thread, started when the first
+subscriber connects and stopped when the last one leaves. The poller tails
+auth_logs by id and pushes each batch to every subscriber queue. Queues are
+bounded: a subscriber that falls behind has its backlog dropped and receives
+a single 'resync' event telling the page to reload its data instead.
+"""
+import queue
+import threading
+import time
+
+from db_interface import get_auth_logs_after, get_max_auth_log_id
+
+class AuthLogBroadcaster:
+    def __init__(self, transform, poll_interval=1.0, batch_size=500, queue_size=100):
+        self.transform = transform
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.last_id = None
+        self.lock = threading.Lock()
+        self.thread = None
+        self.app = None
+
+    def subscribe(self, app, max_subscribers=None):
+        """Register a new subscriber queue, starting the poller if needed. Returns None when max_subscribers are connected."""
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            if max_subscribers is not None and len(self.subscribers) >= max_subscribers:
+                return None
+            self.app = app
+            self.subscribers.add(subscriber)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="auth-log-stream", daemon=True)
+                self.thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscribers)
+
+    def backfill(self, last_id):
+        """Return serialized rows after last_id, for clients reconnecting with Last-Event-ID.
+
+        At most batch_size rows are returned; a full batch means more rows were missed.
+        """
+        with self.app.app_context():
+            rows = get_auth_logs_after(last_id, self.batch_size)
+            return self.transform(rows) if rows else []
+
+    def publish(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Slow consumer: drop its backlog and ask it to reload from the JSON endpoint
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait({"type": "resync", "id": event["id"], "data": {}})
+
+    def _run(self):
+        print("📡 Auth log stream poller started")
+        while True:
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    self.last_id = None
+                    print("📡 Auth log stream poller stopped (no subscribers)")
+                    return
+                app = self.app
+
+            try:
+                with app.app_context():
+                    if self.last_id is None:
+                        self.last_id = get_max_auth_log_id()
+                    rows = get_auth_logs_after(self.last_id, self.batch_size)
+                    if rows:
+                        self.last_id = rows[-1]["id"]
+                        self.publish({"type": "logs", "id": self.last_id, "data": self.transform(rows)})
+            except Exception as e:
+                print(f"⚠️ Auth log stream poll failed: {e}")
+
+            time.sleep(self.poll_interval)
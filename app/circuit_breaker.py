@@ -0,0 +1,140 @@
+"""
+Circuit breaker for calls to a dependency that can go away (the database).
+
+closed:    calls go through; failure_threshold consecutive failures open it.
+open:      calls fail at once for reset_timeout seconds, without touching the network.
+half-open: one caller is let through as a probe. Its success closes the
+           breaker, its failure opens it again; everyone else keeps failing
+           fast until then.
+
+The app and the RADIUS server each keep one breaker per process around their
+database connections; radius/circuit_breaker.py is a copy of this file, since
+each image is built from its own directory. With state_file set, every state
+change is written there as JSON so another process (a health endpoint) can
+report it.
+"""
+import json
+import os
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the dependency while the breaker is open."""
+
+class CircuitBreaker:
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30, open_error=CircuitOpenError, state_file=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.open_error = open_error
+        self.state_file = state_file
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.opened_count = 0
+        self.last_error = None
+        self._probe_started_at = None
+        self._lock = threading.Lock()
+        self._write_state()
+
+    def before_call(self):
+        """Raise open_error unless this caller may use the dependency now (possibly as the half-open probe)."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # A probe that never reported back (e.g. its thread died) is replaced after reset_timeout
+                if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                    self._probe_started_at = now
+                    return
+            retry_after = max(0, int(self.reset_timeout - (now - self.opened_at)))
+        raise self.open_error(f"{self.name} unavailable (circuit {self.state}), retry in {retry_after}s")
+
+    def is_probing(self):
+        """True while the breaker is half-open, i.e. the current call is the single probe."""
+        return self.state == HALF_OPEN
+
+    def release_probe(self):
+        """Let another caller probe: the current one ended without learning anything about the dependency."""
+        with self._lock:
+            self._probe_started_at = None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_started_at = None
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error) if error is not None else None
+            self._probe_started_at = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.opened_count += 1
+                self._transition(OPEN)
+
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker; any exception counts as a failure and is re-raised."""
+        self.before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def snapshot(self):
+        """Return the breaker state as a JSON-ready dict."""
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        open_for = time.monotonic() - self.opened_at if self.state != CLOSED and self.opened_at else None
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "reset_timeout": self.reset_timeout,
+            "open_seconds": round(open_for, 1) if open_for is not None else None,
+            "opened_count": self.opened_count,
+            "last_error": self.last_error,
+            "updated_at": time.time(),
+        }
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        icon = {CLOSED: "✅", OPEN: "🛑", HALF_OPEN: "🔎"}[state]
+        print(f"{icon} Circuit breaker '{self.name}': {previous} → {state}")
+        self._write_state()
+
+    def _write_state(self):
+        if not self.state_file:
+            return
+        try:
+            tmp_path = f"{self.state_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._snapshot(), f)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            print(f"⚠️ Could not write circuit breaker state to {self.state_file}: {e}")
+
+def read_state_file(path):
+    """Return the snapshot another process wrote to path, or None if there is none."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -21,6 +21,30 @@ class Config:
     OUI_API_KEY = os.getenv('OUI_API_KEY', '')
     OUI_API_LIMIT_PER_SEC = int(os.getenv('OUI_API_LIMIT_PER_SEC', '2'))
     OUI_API_DAILY_LIMIT = int(os.getenv('OUI_API_DAILY_LIMIT', '10000'))
+    # Parallel API connections used by the vendor refresh (throughput is still capped by the rate limit)
+    OUI_API_CONCURRENCY = int(os.getenv('OUI_API_CONCURRENCY', '4'))
+    # How often each worker reloads the imported IEEE OUI registry from mac_vendors
+    OUI_REGISTRY_RELOAD_INTERVAL = int(os.getenv('OUI_REGISTRY_RELOAD_INTERVAL', '3600'))
+
+    # Caching (groups and web UI accounts are shared by all workers and invalidated by writes)
+    GROUP_CACHE_TTL = int(os.getenv('GROUP_CACHE_TTL', '30'))
+    TABLE_STATS_CACHE_TTL = int(os.getenv('TABLE_STATS_CACHE_TTL', '300'))
+    # Web UI accounts looked up by Flask-Login on every authenticated request
+    AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', '60'))
+    # Per-worker LRU of vendor names by MAC prefix (backed by the shared cache); prefixes without a vendor expire after the negative TTL,
+    # and expired entries are served for up to the stale TTL while they are reread in the background
+    VENDOR_CACHE_SIZE = int(os.getenv('VENDOR_CACHE_SIZE', '10000'))
+    VENDOR_CACHE_TTL = int(os.getenv('VENDOR_CACHE_TTL', '3600'))
+    VENDOR_CACHE_NEGATIVE_TTL = int(os.getenv('VENDOR_CACHE_NEGATIVE_TTL', '300'))
+    VENDOR_CACHE_STALE_TTL = int(os.getenv('VENDOR_CACHE_STALE_TTL', '86400'))
+    # Stats dashboard responses shared by every open tab; keep at or below the shortest refresh interval
+    STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '15'))
+    # Live auth log stream (SSE); each subscriber holds one gunicorn thread
+    STATS_STREAM_MAX_SUBSCRIBERS = int(os.getenv('STATS_STREAM_MAX_SUBSCRIBERS', '4'))
+    STATS_STREAM_HEARTBEAT = int(os.getenv('STATS_STREAM_HEARTBEAT', '15'))
+
+    # Stats page totals: 'approx' (optimizer estimate), 'exact' (COUNT(*)) or 'none'
+    STATS_PAGE_TOTALS = os.getenv('STATS_PAGE_TOTALS', 'approx')
 
     # Timezone
     APP_TIMEZONE = os.getenv('APP_TIMEZONE', 'UTC')
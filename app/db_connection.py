@@ -1,11 +1,59 @@
 import mysql.connector
 from mysql.connector import pooling
+from flask import g, has_app_context
+from db_pool import InstrumentedPool, default_pool_size
+from circuit_breaker import CircuitBreaker, CLOSED
 import os
+import threading
 import time
 
 # Create connection pool for better reliability
 _connection_pool = None
 
+# Optional read-only pool pointed at a replica (DB_READ_HOST). Reads fall back
+# to the primary when it is not configured, unreachable or lagging.
+_read_pool = None
+_read_pool_failed_at = 0.0
+_replica_state = {"checked_at": 0.0, "healthy": False, "lag": None}
+_replica_lock = threading.Lock()
+
+READ_MAX_LAG = int(os.getenv('DB_READ_MAX_LAG', 10))
+READ_LAG_CHECK_INTERVAL = int(os.getenv('DB_READ_LAG_CHECK_INTERVAL', 5))
+READ_RETRY_INTERVAL = int(os.getenv('DB_READ_RETRY_INTERVAL', 30))
+# Pooled connections idle for longer than this are pinged (and reconnected) on checkout
+PING_IDLE_SECONDS = int(os.getenv('DB_PING_IDLE_SECONDS', 30))
+# Beyond the pool: temporary connections, then a bounded queue of callers waiting for one
+POOL_OVERFLOW = int(os.getenv('DB_POOL_OVERFLOW', 4))
+POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))
+POOL_MAX_WAITERS = int(os.getenv('DB_POOL_MAX_WAITERS', 16))
+
+class DatabaseUnavailable(mysql.connector.errors.OperationalError):
+    """Raised without touching the network while the database circuit breaker is open."""
+
+# Trips after DB_BREAKER_FAILURE_THRESHOLD consecutive failed checkouts, so an
+# outage costs each request nothing instead of a full round of retries
+db_breaker = CircuitBreaker(
+    "database",
+    failure_threshold=int(os.getenv('DB_BREAKER_FAILURE_THRESHOLD', 5)),
+    reset_timeout=int(os.getenv('DB_BREAKER_RESET_TIMEOUT', 15)),
+    open_error=DatabaseUnavailable,
+)
+
+# Called as listener(statement, params, duration) after every statement run on
+# a connection from get_connection()/get_read_connection() (request timing)
+_query_listeners = []
+
+def add_query_listener(listener):
+    """Register listener(statement, params, duration_seconds) to be called after each executed statement."""
+    _query_listeners.append(listener)
+
+def _report_query(statement, params, duration):
+    for listener in _query_listeners:
+        try:
+            listener(statement, params, duration)
+        except Exception as e:
+            print(f"⚠️ Query listener failed: {e}")
+
 def init_connection_pool():
     """Initialize the database connection pool"""
     global _connection_pool
@@ -19,8 +67,11 @@ def init_connection_pool():
                 'database': os.getenv('DB_NAME'),
                 'autocommit': True,
                 'pool_name': 'app_pool',
-                'pool_size': 10,
+                'pool_size': default_pool_size(),
                 'pool_reset_session': True,
+                # Request-scoped connections are shared by many functions; discard
+                # rows one of them left unread instead of failing the next query
+                'consume_results': True,
                 'connect_timeout': 20,  # Increased from 10
                 'charset': 'utf8mb4',
                 'collation': 'utf8mb4_unicode_ci',
@@ -31,33 +82,172 @@ def init_connection_pool():
                 'use_unicode': True
             }
             
-            _connection_pool = mysql.connector.pooling.MySQLConnectionPool(**db_config)
-            print("✅ App database connection pool initialized successfully")
+            _connection_pool = InstrumentedPool(overflow=POOL_OVERFLOW, timeout=POOL_TIMEOUT,
+                                                max_waiters=POOL_MAX_WAITERS, **db_config)
+            print(f"✅ App database connection pool initialized successfully "
+                  f"(size {_connection_pool.pool_size}, overflow {POOL_OVERFLOW})")
             
         except Exception as e:
             print(f"❌ Failed to initialize app database connection pool: {e}")
             raise
 
-def get_connection():
-    """Get a database connection with automatic retry and better error handling"""
-    global _connection_pool
-    
-    # Initialize pool if needed
-    if _connection_pool is None:
-        init_connection_pool()
-    
-    max_retries = 3
+def _mark_used(conn):
+    # PooledMySQLConnection wraps the real connection, which outlives checkouts
+    getattr(conn, "_cnx", conn)._radmac_last_used = time.monotonic()
+
+def _ping_if_idle(conn):
+    """Ping a pooled connection only if it sat idle past PING_IDLE_SECONDS."""
+    last_used = getattr(getattr(conn, "_cnx", conn), "_radmac_last_used", 0.0)
+    if time.monotonic() - last_used > PING_IDLE_SECONDS:
+        conn.ping(reconnect=True)
+    _mark_used(conn)
+
+class _TimedCursor:
+    """A cursor that reports each statement and its duration to the query listeners."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            if _query_listeners:
+                _report_query(operation, params, time.perf_counter() - started)
+
+    def executemany(self, operation, seq_params):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params)
+        finally:
+            if _query_listeners:
+                _report_query(operation, None, time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _SharedCursor(_TimedCursor):
+    """A cursor of a request-scoped connection; close() hands it to the next caller instead of closing it."""
+
+    def __init__(self, cursor, free_list):
+        super().__init__(cursor)
+        self._free_list = free_list
+        self._released = False
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._free_list.append(self)
+        return True
+
+class _TimedConnection:
+    """A connection of the caller's own (request_scoped=False) whose cursors are timed."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, **kwargs):
+        return _TimedCursor(self._conn.cursor(**kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class RequestConnection:
+    """One pooled connection held for a whole request (or job), shared by every db function it calls.
+
+    close() leaves it open; release_request_connections(), registered as an
+    app teardown handler, returns it to the pool. Cursors are reused: a closed cursor is handed to the next
+    cursor() call with the same options. Unbuffered (buffered=False) cursors
+    are never shared.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._free_cursors = {}
+        self._cursors = []
+
+    def cursor(self, **kwargs):
+        if kwargs.get("buffered") is False or kwargs.get("prepared"):
+            cursor = self._conn.cursor(**kwargs)
+            self._cursors.append(cursor)
+            return _TimedCursor(cursor)
+        free_list = self._free_cursors.setdefault(tuple(sorted(kwargs.items())), [])
+        if free_list:
+            cursor = free_list.pop()
+            cursor._released = False
+            return cursor
+        cursor = _SharedCursor(self._conn.cursor(**kwargs), free_list)
+        self._cursors.append(cursor._cursor)
+        return cursor
+
+    def close(self):
+        pass
+
+    def release(self):
+        """Close the cursors and return the connection to its pool."""
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+        self._cursors = []
+        self._free_cursors = {}
+        _mark_used(self._conn)
+        self._conn.close()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+def get_connection(request_scoped=True):
+    """Get a database connection, reused for the rest of the request when called inside an app context.
+
+    Pass request_scoped=False for a connection of your own (session settings,
+    long-running streams); close() returns it to the pool as usual.
+    """
+    if request_scoped and has_app_context():
+        conn = g.get("_db_conn")
+        if conn is None:
+            conn = g._db_conn = RequestConnection(_checkout_connection())
+        return conn
+    return _TimedConnection(_checkout_connection())
+
+def _checkout_connection():
+    """Check a connection out of the pool with retries, failing fast while the circuit breaker is open"""
+    db_breaker.before_call()
+
+    # The half-open probe gets a single attempt
+    max_retries = 1 if db_breaker.is_probing() else 3
     retry_delay = 1.0
     
     for attempt in range(max_retries):
+        conn = None
         try:
+            # Initialize pool if needed
+            if _connection_pool is None:
+                init_connection_pool()
             conn = _connection_pool.get_connection()
-            conn.ping(reconnect=True)
+            _ping_if_idle(conn)
+            db_breaker.record_success()
             return conn
-            
+
+        except mysql.connector.errors.PoolError as e:
+            # The pool already waited up to DB_POOL_TIMEOUT; retrying would only pile up more threads
+            print(f"❌ Database connection pool exhausted: {e}")
+            db_breaker.release_probe()
+            raise
         except mysql.connector.Error as e:
             print(f"❌ Database connection attempt {attempt + 1} failed: {e}")
-            if attempt < max_retries - 1:
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            db_breaker.record_failure(e)
+            if attempt < max_retries - 1 and db_breaker.state == CLOSED:
                 print(f"⏳ Retrying in {retry_delay} seconds...")
                 time.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
@@ -67,3 +257,144 @@ def get_connection():
         except Exception as e:
             print(f"❌ Unexpected error getting database connection: {e}")
             raise
+
+
+def init_read_pool():
+    """Initialize the read-only replica pool if DB_READ_HOST is set. Returns True when available."""
+    global _read_pool, _read_pool_failed_at
+    if _read_pool is not None:
+        return True
+    if not os.getenv('DB_READ_HOST'):
+        return False
+    if _read_pool_failed_at and time.monotonic() - _read_pool_failed_at < READ_RETRY_INTERVAL:
+        return False
+
+    try:
+        _read_pool = InstrumentedPool(
+            overflow=POOL_OVERFLOW,
+            timeout=POOL_TIMEOUT,
+            max_waiters=POOL_MAX_WAITERS,
+            host=os.getenv('DB_READ_HOST'),
+            port=int(os.getenv('DB_READ_PORT', os.getenv('DB_PORT', 3306))),
+            user=os.getenv('DB_READ_USER', os.getenv('DB_USER')),
+            password=os.getenv('DB_READ_PASSWORD', os.getenv('DB_PASSWORD')),
+            database=os.getenv('DB_READ_NAME', os.getenv('DB_NAME')),
+            autocommit=True,
+            pool_name='app_read_pool',
+            pool_size=int(os.getenv('DB_READ_POOL_SIZE', default_pool_size())),
+            pool_reset_session=True,
+            connect_timeout=5,
+            charset='utf8mb4',
+            collation='utf8mb4_unicode_ci',
+            sql_mode='',
+            raise_on_warnings=False,
+            use_unicode=True
+        )
+        print("✅ App read replica connection pool initialized successfully")
+        return True
+    except Exception as e:
+        _read_pool_failed_at = time.monotonic()
+        print(f"⚠️ Failed to initialize read replica pool, reads will use the primary: {e}")
+        return False
+
+def _replica_lag(conn):
+    """Return replication lag in seconds, 0 for a standalone read target, or None if replication is broken."""
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SHOW SLAVE STATUS")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        return 0
+    lag = rows[0].get('Seconds_Behind_Master')
+    return int(lag) if lag is not None else None
+
+def _replica_is_usable(conn):
+    """Check (at most every DB_READ_LAG_CHECK_INTERVAL seconds) that the replica is within DB_READ_MAX_LAG."""
+    with _replica_lock:
+        if time.monotonic() - _replica_state["checked_at"] < READ_LAG_CHECK_INTERVAL:
+            return _replica_state["healthy"]
+
+        try:
+            lag = _replica_lag(conn)
+        except mysql.connector.Error as e:
+            print(f"⚠️ Replica lag check failed: {e}")
+            lag = None
+
+        healthy = lag is not None and lag <= READ_MAX_LAG
+        if healthy != _replica_state["healthy"]:
+            if healthy:
+                print(f"✅ Read replica in use (lag {lag}s)")
+            else:
+                print(f"⚠️ Read replica unusable (lag {lag}), falling back to primary")
+        _replica_state.update(checked_at=time.monotonic(), healthy=healthy, lag=lag)
+        return healthy
+
+def get_read_connection(request_scoped=True):
+    """Get a connection for read-only queries: the replica when healthy, otherwise the primary.
+
+    Like get_connection(), reused for the rest of the request inside an app context.
+    """
+    if request_scoped and has_app_context():
+        conn = g.get("_db_read_conn")
+        if conn is None:
+            conn = _checkout_read_connection()
+            # Falling back to the primary reuses the request's primary connection
+            conn = g._db_read_conn = RequestConnection(conn) if conn is not None else get_connection()
+        return conn
+    return _TimedConnection(_checkout_read_connection() or _checkout_connection())
+
+def _checkout_read_connection():
+    """Check a connection out of the replica pool, or return None when reads should use the primary."""
+    if init_read_pool():
+        conn = None
+        try:
+            conn = _read_pool.get_connection()
+            _ping_if_idle(conn)
+            if _replica_is_usable(conn):
+                return conn
+            conn.close()
+        except mysql.connector.errors.PoolError as e:
+            print(f"⚠️ Read replica pool busy, using primary: {e}")
+        except mysql.connector.Error as e:
+            print(f"⚠️ Read replica unavailable, using primary: {e}")
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            with _replica_lock:
+                _replica_state.update(checked_at=time.monotonic(), healthy=False, lag=None)
+
+    return None
+
+def release_request_connections(exception=None):
+    """Return the connections held by the current app context to their pools."""
+    read_conn = g.pop("_db_read_conn", None)
+    conn = g.pop("_db_conn", None)
+    for held in {id(c): c for c in (read_conn, conn) if c is not None}.values():
+        try:
+            held.release()
+        except Exception as e:
+            print(f"⚠️ Failed to return database connection to the pool: {e}")
+
+def get_replica_status():
+    """Return the last known read replica state for health reporting."""
+    with _replica_lock:
+        return {
+            "configured": bool(os.getenv('DB_READ_HOST')),
+            "healthy": _replica_state["healthy"],
+            "lag_seconds": _replica_state["lag"],
+        }
+
+def get_pool_stats():
+    """Return checkout, wait and exhaustion counters of this worker's pools for /health and /metrics."""
+    return {
+        "primary": _connection_pool.stats() if _connection_pool is not None else None,
+        "replica": _read_pool.stats() if _read_pool is not None else None,
+    }
+
+def get_breaker_state():
+    """Return this worker's database circuit breaker state for /health."""
+    return db_breaker.snapshot()
@@ -1,5 +1,9 @@
 from flask import current_app, request, redirect, url_for, flash
-from db_connection import get_connection
+from db_connection import get_connection, get_read_connection, DatabaseUnavailable
+from streaming import iter_sql_statements
+from ttl_cache import TTLCache, MISS, STALE
+import shared_cache
+import oui_api
 from datetime import datetime, timedelta, timezone
 import mysql.connector
 import requests
@@ -8,11 +12,22 @@ import os
 import subprocess
 import pytz
 import shutil
+import threading
+import base64
+import csv
+import io
+import json
+import re
+import gzip
 
 def safe_db_operation(operation_func, default_return=None):
     """Wrapper for database operations with proper error handling"""
     try:
         return operation_func()
+    except DatabaseUnavailable:
+        # Answered with a 503 by the app's error handler; a default here could
+        # e.g. make an empty auth_users count reopen enrollment
+        raise
     except mysql.connector.Error as e:
         print(f"❌ Database error: {e}")
         if current_app:
@@ -24,6 +39,17 @@ def safe_db_operation(operation_func, default_return=None):
             flash(f"An unexpected error occurred. Please try again.", "error")
         return default_return
 
+# Web UI accounts by id and the account count, shared by all workers under the
+# 'auth_users' version stamp. Every account write bumps it, so a changed
+# password is seen everywhere at once; AUTH_USER_CACHE_TTL only bounds how long
+# unused entries are kept.
+def _auth_cache_ttl():
+    return current_app.config.get("AUTH_USER_CACHE_TTL", 60) if current_app else 60
+
+def invalidate_auth_user_cache():
+    """Make every worker reread web UI accounts and the account count."""
+    shared_cache.bump_version("auth_users")
+
 def count_auth_users():
     def _operation():
         conn = get_connection()
@@ -33,8 +59,21 @@ def count_auth_users():
         cursor.close()
         conn.close()
         return count
-    
-    return safe_db_operation(_operation, 0)
+
+    def _cached_count():
+        # Only a non-zero count is cached: version stamps are per host, so a cached 0
+        # could keep /enroll open on another host after the first account was created
+        key = shared_cache.versioned_key("auth_users", "count")
+        count = shared_cache.get(key)
+        if count:
+            return count
+        count = _operation()
+        if count:
+            shared_cache.put(key, count, _auth_cache_ttl())
+        return count
+
+    # A failed query returns 0 without being cached
+    return safe_db_operation(_cached_count, 0)
 
 def add_auth_user(username, password_hash):
     conn = get_connection()
@@ -43,6 +82,7 @@ def add_auth_user(username, password_hash):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_auth_user_cache()
 
 def update_auth_username(user_id, new_username):
     conn = get_connection()
@@ -51,6 +91,7 @@ def update_auth_username(user_id, new_username):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_auth_user_cache()
 
 def update_auth_password(user_id, new_password_hash):
     conn = get_connection()
@@ -59,17 +100,24 @@ def update_auth_password(user_id, new_password_hash):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_auth_user_cache()
 # ------------------------------
 # Web UI Authentication Functions
 # ------------------------------
 def get_auth_user_by_id(user_id):
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT * FROM auth_users WHERE id = %s", (user_id,))
-    user = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return user
+    """Return the web UI account with this id, served from the shared cache (Flask-Login calls this on every request)."""
+    user_id = int(user_id)
+
+    def _load():
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT * FROM auth_users WHERE id = %s", (user_id,))
+        user = cursor.fetchone()
+        cursor.close()
+        conn.close()
+        return user
+
+    return shared_cache.get_versioned("auth_users", f"id:{user_id}", _auth_cache_ttl(), _load)
 
 def get_auth_user_by_username(username):
     conn = get_connection()
@@ -87,23 +135,134 @@ def get_auth_user_by_username(username):
 
 def get_all_users():
     """Retrieve all users with associated group and vendor information."""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor(dictionary=True)
     cursor.execute("""
         SELECT 
             u.*, 
             g.vlan_id AS group_vlan_id, 
             g.description AS group_description,
-            COALESCE(m.vendor_name, '...') AS vendor
+            COALESCE(m9.vendor_name, m7.vendor_name, m.vendor_name, '...') AS vendor
         FROM users u
         LEFT JOIN groups g ON u.vlan_id = g.vlan_id
-        LEFT JOIN mac_vendors m ON LOWER(REPLACE(REPLACE(u.mac_address, ':', ''), '-', '')) LIKE CONCAT(m.mac_prefix, '%')
+        LEFT JOIN mac_vendors m9 ON m9.mac_prefix = LEFT(u.mac_address, 9)
+        LEFT JOIN mac_vendors m7 ON m7.mac_prefix = LEFT(u.mac_address, 7)
+        LEFT JOIN mac_vendors m ON m.mac_prefix = LEFT(u.mac_address, 6)
     """)
     users = cursor.fetchall()
     cursor.close()
     conn.close()
     return users
 
+USER_SORT_COLUMNS = {
+    # sort name: (column, nullable) -- each is indexed together with the mac_address primary key
+    'mac': ('u.mac_address', False),
+    'description': ('u.description', True),
+    'vlan': ('u.vlan_id', False),
+}
+
+def encode_user_cursor(value, mac_address):
+    """Encode a (sort value, mac_address) keyset position as a URL-safe string."""
+    raw = json.dumps([value, mac_address]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_user_cursor(cursor_value):
+    """Decode a cursor from encode_user_cursor(), returning (value, mac_address) or None."""
+    try:
+        value, mac_address = json.loads(base64.urlsafe_b64decode(cursor_value.encode('ascii')))
+        return value, mac_address
+    except (AttributeError, ValueError, TypeError):
+        return None
+
+def _keyset_condition(column, nullable, descending, value, mac_address):
+    """Build a WHERE clause selecting rows after (value, mac_address) in (column, mac) order.
+
+    MariaDB sorts NULLs first ascending and last descending, which nullable
+    columns have to account for.
+    """
+    op = "<" if descending else ">"
+    if not nullable:
+        return f"({column} {op} %s OR ({column} = %s AND u.mac_address {op} %s))", [value, value, mac_address]
+    if value is None:
+        clause = f"({column} IS NULL AND u.mac_address {op} %s)"
+        if not descending:
+            clause = f"({clause} OR {column} IS NOT NULL)"
+        return clause, [mac_address]
+    clause = f"({column} {op} %s OR ({column} = %s AND u.mac_address {op} %s)"
+    clause += f" OR {column} IS NULL)" if descending else ")"
+    return clause, [value, value, mac_address]
+
+def _escape_like(value):
+    """Escape LIKE wildcards in user input so % and _ match literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def search_users(mac=None, mac_match='prefix', description=None, vlan_id=None, vendor=None,
+                 sort='mac', order='asc', cursor=None, limit=100):
+    """Return one keyset-paginated page of users matching the given filters.
+
+    MAC filters match as a prefix (index range) unless mac_match is 'contains'.
+    Returns {'users': [...], 'next_cursor': str or None}.
+    """
+    column, nullable = USER_SORT_COLUMNS.get(sort, USER_SORT_COLUMNS['mac'])
+    descending = order == 'desc'
+    direction = "DESC" if descending else "ASC"
+
+    filters = []
+    params = []
+
+    if mac:
+        mac = _escape_like(mac.lower().replace(":", "").replace("-", "").replace(".", ""))
+        filters.append("u.mac_address LIKE %s")
+        params.append(f"%{mac}%" if mac_match == 'contains' else f"{mac}%")
+    if description:
+        filters.append("u.description LIKE %s")
+        params.append(f"%{_escape_like(description)}%")
+    if vlan_id:
+        filters.append("u.vlan_id = %s")
+        params.append(vlan_id)
+    if vendor:
+        # A substring match on the joined vendor rows: filtered while scanning users, no index applies
+        filters.append("COALESCE(m9.vendor_name, m7.vendor_name, m.vendor_name) LIKE %s")
+        params.append(f"%{_escape_like(vendor)}%")
+
+    position = decode_user_cursor(cursor) if cursor else None
+    if position:
+        clause, clause_params = _keyset_condition(column, nullable, descending, *position)
+        filters.append(clause)
+        params.extend(clause_params)
+
+    query = """
+        SELECT
+            u.*,
+            g.description AS group_description,
+            COALESCE(m9.vendor_name, m7.vendor_name, m.vendor_name, '...') AS vendor
+        FROM users u
+        LEFT JOIN groups g ON u.vlan_id = g.vlan_id
+        LEFT JOIN mac_vendors m9 ON m9.mac_prefix = LEFT(u.mac_address, 9)
+        LEFT JOIN mac_vendors m7 ON m7.mac_prefix = LEFT(u.mac_address, 7)
+        LEFT JOIN mac_vendors m ON m.mac_prefix = LEFT(u.mac_address, 6)
+    """
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    query += f" ORDER BY {column} {direction}, u.mac_address {direction} LIMIT %s"
+    params.append(limit + 1)
+
+    conn = get_read_connection()
+    db_cursor = conn.cursor(dictionary=True)
+    db_cursor.execute(query, tuple(params))
+    users = db_cursor.fetchall()
+    db_cursor.close()
+    conn.close()
+
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        last = users[-1]
+        sort_key = column.split('.', 1)[1]
+        next_cursor = encode_user_cursor(last[sort_key], last['mac_address'])
+
+    return {"users": users, "next_cursor": next_cursor}
+
 def get_user_by_mac(mac_address):
     """Retrieve a user record from the database by MAC address."""
     conn = get_connection()
@@ -126,6 +285,11 @@ def get_users_by_vlan_id(vlan_id):
     conn.close()
     return users
 
+def invalidate_user_cache():
+    """Record a users write: bumps the 'users' version stamp (part of the stats ETag) and the group list."""
+    shared_cache.bump_version("users")
+    invalidate_group_cache()
+
 def add_user(mac_address, description, vlan_id):
     """Insert a new user with MAC address, description, and VLAN assignment."""
     print(f"→ Adding to DB: mac={mac_address}, desc={description}, vlan={vlan_id}")
@@ -138,6 +302,7 @@ def add_user(mac_address, description, vlan_id):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_user_cache()
 
 def update_user(mac_address, description, vlan_id):
     """Update both description and VLAN ID for a given MAC address."""
@@ -150,6 +315,7 @@ def update_user(mac_address, description, vlan_id):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_user_cache()
 
 def delete_user(mac_address):
     """Remove a user from the database by their MAC address."""
@@ -159,27 +325,167 @@ def delete_user(mac_address):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_user_cache()
+
+MAC_RE = re.compile(r'^[0-9a-f]{12}$')
+
+def normalize_mac(mac):
+    """Return mac as 12 lowercase hex digits (accepting :, - and . separators), or None if invalid."""
+    if not mac:
+        return None
+    mac = re.sub(r'[\s:\-.]', '', mac).lower()
+    return mac if MAC_RE.match(mac) else None
+
+def _flush_user_batch(conn, cursor, batch):
+    """Upsert a batch of (mac, description, vlan_id) rows in one multi-row statement."""
+    placeholders = ", ".join(["(%s, %s, %s)"] * len(batch))
+    cursor.execute(f"""
+        INSERT INTO users (mac_address, description, vlan_id) VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE description = VALUES(description), vlan_id = VALUES(vlan_id)
+    """, tuple(value for row in batch for value in row))
+    conn.commit()
+    # MariaDB reports 1 per inserted row and 2 per updated row
+    return cursor.rowcount
+
+def import_users_csv(text_stream, batch_size=1000, progress=None, max_errors=1000):
+    """Upsert users from a CSV of mac,description,vlan read incrementally from text_stream.
+
+    Rows are normalized and validated (MAC format, description length, VLAN
+    must exist in groups) and written in batched multi-row transactions.
+    progress, if given, is called with the running summary after each batch.
+    Returns {'processed', 'imported', 'affected', 'errors': [{'line', 'error'}]}.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT vlan_id FROM groups")
+    known_vlans = {str(row[0]) for row in cursor.fetchall()}
+
+    summary = {"processed": 0, "imported": 0, "affected": 0, "errors": []}
+    batch = []
+    seen = {}
+
+    def add_error(line, message):
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append({"line": line, "error": message})
+
+    try:
+        reader = csv.reader(text_stream)
+        for row in reader:
+            line_no = reader.line_num
+            if not row or all(not cell.strip() for cell in row):
+                continue
+            if line_no == 1 and row[0].strip().lower() in ("mac", "mac_address"):
+                continue
+
+            summary["processed"] += 1
+            if len(row) < 3:
+                add_error(line_no, "Expected mac,description,vlan")
+                continue
+
+            mac = normalize_mac(row[0])
+            description = row[1].strip() or None
+            vlan_id = row[2].strip()
+
+            if not mac:
+                add_error(line_no, f"Invalid MAC address '{row[0].strip()}'")
+                continue
+            if description and len(description) > 200:
+                add_error(line_no, "Description longer than 200 characters")
+                continue
+            if vlan_id not in known_vlans:
+                add_error(line_no, f"Unknown VLAN '{vlan_id}'")
+                continue
+            if mac in seen:
+                add_error(line_no, f"Duplicate MAC {mac} (also on line {seen[mac]}), last row wins")
+            seen[mac] = line_no
+
+            batch.append((mac, description, vlan_id))
+            if len(batch) >= batch_size:
+                summary["affected"] += _flush_user_batch(conn, cursor, batch)
+                summary["imported"] += len(batch)
+                batch = []
+                if progress:
+                    progress(summary)
+
+        if batch:
+            summary["affected"] += _flush_user_batch(conn, cursor, batch)
+            summary["imported"] += len(batch)
+            if progress:
+                progress(summary)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+        invalidate_user_cache()
+
+    print(f"→ User import finished: {summary['imported']} imported, {len(summary['errors'])} errors")
+    return summary
+
+def iter_users_csv(fetch_size=1000):
+    """Yield the users table as CSV text chunks, streaming from an unbuffered server-side cursor."""
+    conn = get_read_connection(request_scoped=False)
+    cursor = conn.cursor(buffered=False)
+    try:
+        cursor.execute("SELECT mac_address, description, vlan_id FROM users ORDER BY mac_address")
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["mac_address", "description", "vlan_id"])
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        # The client may disconnect mid-stream, leaving unread rows on the cursor
+        try:
+            cursor.close()
+        except mysql.connector.Error:
+            pass
+        conn.close()
 
 
 # ------------------------------
 # Group Management Functions
 # ------------------------------
 
+# get_all_groups() is shared by all workers under the 'groups' version stamp,
+# which group writes and user writes (user counts) bump.
+def invalidate_group_cache():
+    """Make every worker reload the group list on its next read."""
+    shared_cache.bump_version("groups")
+
 def get_all_groups():
     """Retrieve all groups along with user count for each group."""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-        SELECT g.*, (
-            SELECT COUNT(*) FROM users WHERE vlan_id = g.vlan_id
-        ) AS user_count
-        FROM groups g
-        ORDER BY g.vlan_id
-    """)
-    available_groups = cursor.fetchall()
-    cursor.close()
-    conn.close()
-    return available_groups
+    ttl = current_app.config.get("GROUP_CACHE_TTL", 30) if current_app else 30
+
+    def _load():
+        conn = get_connection()
+        cursor = conn.cursor(dictionary=True)
+        # Aggregate users once (covered by idx_users_vlan_id) and join the totals
+        # back, instead of a correlated COUNT(*) per group.
+        cursor.execute("""
+            SELECT g.*, COALESCE(c.user_count, 0) AS user_count
+            FROM groups g
+            LEFT JOIN (
+                SELECT vlan_id, COUNT(*) AS user_count
+                FROM users
+                GROUP BY vlan_id
+            ) c ON c.vlan_id = g.vlan_id
+            ORDER BY g.vlan_id
+        """)
+        available_groups = cursor.fetchall()
+        cursor.close()
+        conn.close()
+        return available_groups
+
+    return shared_cache.get_versioned("groups", "all", ttl, _load)
 
 def add_group(vlan_id, description):
     """Insert a new group with a specified VLAN ID and description."""
@@ -189,6 +495,7 @@ def add_group(vlan_id, description):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_group_cache()
 
 def update_group_description(vlan_id, description):
     """Update the description for a given MAC address in the users table."""
@@ -199,6 +506,7 @@ def update_group_description(vlan_id, description):
     conn.commit()
     cursor.close()
     conn.close()
+    invalidate_group_cache()
 
 def delete_group(vlan_id, force_delete=False):
     """Delete a group, and optionally its associated users if force_delete=True."""
@@ -209,6 +517,10 @@ def delete_group(vlan_id, force_delete=False):
             cursor.execute("DELETE FROM users WHERE vlan_id = %s", (vlan_id,))
         cursor.execute("DELETE FROM groups WHERE vlan_id = %s", (vlan_id,))
         conn.commit()
+        if force_delete:
+            invalidate_user_cache()
+        else:
+            invalidate_group_cache()
     except mysql.connector.IntegrityError as e:
         print(f"❌ Cannot delete group '{vlan_id}': it is still in use. Error: {e}")
         raise
@@ -241,6 +553,10 @@ def delete_group_route():
             cursor.execute("DELETE FROM users WHERE vlan_id = %s", (vlan_id,))
         cursor.execute("DELETE FROM groups WHERE vlan_id = %s", (vlan_id,))
         conn.commit()
+        if force:
+            invalidate_user_cache()
+        else:
+            invalidate_group_cache()
         flash(f"Group {vlan_id} and associated users deleted." if force else f"Group {vlan_id} deleted.", "success")
     except mysql.connector.IntegrityError as e:
         flash(f"Cannot delete group {vlan_id}: it is still in use. Error: {e}", "error")
@@ -258,284 +574,440 @@ def delete_group_route():
 # MAC Vendor Functions
 # ------------------------------
 
-def get_known_mac_vendors():
-    """Fetch all known MAC prefixes and their vendor info from the local database."""
+# IEEE registries and the length of their assignments in hex digits
+OUI_REGISTRY_PREFIX_LENGTHS = {"MA-S": 9, "MA-M": 7, "MA-L": 6}
+OUI_PREFIX_RE = re.compile(r'^[0-9a-f]{6}([0-9a-f]|[0-9a-f]{3})?$')
+
+# Imported IEEE assignments ({prefix: vendor}) for longest-prefix lookups,
+# reloaded from mac_vendors after OUI_REGISTRY_RELOAD_INTERVAL seconds or when
+# the 'vendors' version stamp changes
+_oui_registry = {"prefixes": None, "loaded_at": 0.0, "version": None}
+_oui_registry_lock = threading.Lock()
+
+def _get_oui_registry():
+    interval = current_app.config.get("OUI_REGISTRY_RELOAD_INTERVAL", 3600) if current_app else 3600
+    version = shared_cache.get_version("vendors")
+    with _oui_registry_lock:
+        prefixes = _oui_registry["prefixes"]
+        if (prefixes is not None and _oui_registry["version"] == version
+                and time.monotonic() - _oui_registry["loaded_at"] < interval):
+            return prefixes
+
+        conn = get_read_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT mac_prefix, vendor_name FROM mac_vendors WHERE source = 'ieee'")
+            prefixes = {prefix.lower(): vendor for prefix, vendor in cursor.fetchall()}
+        finally:
+            cursor.close()
+            conn.close()
+        _oui_registry["prefixes"] = prefixes
+        _oui_registry["loaded_at"] = time.monotonic()
+        _oui_registry["version"] = version
+        return prefixes
+
+def lookup_oui(mac):
+    """Return the IEEE registry vendor for a MAC by longest-prefix match (36, 28, then 24 bits), or None."""
+    mac = mac.lower().replace(":", "").replace("-", "").replace(".", "")
+    prefixes = _get_oui_registry()
+    for length in (9, 7, 6):
+        vendor = prefixes.get(mac[:length])
+        if vendor:
+            return vendor
+    return None
+
+def parse_oui_csv(text_stream):
+    """Yield (prefix, vendor_name) from an IEEE MA-L, MA-M or MA-S CSV export.
+
+    The IEEE files (oui.csv, mam.csv, oui36.csv) have the columns
+    Registry,Assignment,Organization Name,Organization Address.
+    """
+    for row in csv.reader(text_stream):
+        if len(row) < 3 or row[0].strip() not in OUI_REGISTRY_PREFIX_LENGTHS:
+            continue  # header or malformed row
+        prefix = row[1].strip().lower()
+        vendor = row[2].strip()
+        if len(prefix) != OUI_REGISTRY_PREFIX_LENGTHS[row[0].strip()] or not OUI_PREFIX_RE.match(prefix) or not vendor:
+            continue
+        yield prefix, vendor[:255]
+
+def import_oui_registry(text_stream, batch_size=1000, progress=None):
+    """Upsert an IEEE OUI registry CSV into mac_vendors in batches, returning the number of assignments read.
+
+    Imported rows are marked source='ieee' and replace API results for the
+    same prefix. progress, if given, is called with the running count after
+    each batch.
+    """
     conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    cursor.execute("SELECT mac_prefix, vendor_name, status FROM mac_vendors")
-    entries = cursor.fetchall()
-    cursor.close()
-    conn.close()
+    cursor = conn.cursor()
+    processed = 0
+    batch = []
+
+    def flush():
+        placeholders = ", ".join(["(%s, %s, 'found', 'ieee', NOW(), NOW())"] * len(batch))
+        cursor.execute(f"""
+            INSERT INTO mac_vendors (mac_prefix, vendor_name, status, source, last_checked, last_updated)
+            VALUES {placeholders}
+            ON DUPLICATE KEY UPDATE
+                vendor_name = VALUES(vendor_name),
+                status = 'found',
+                source = 'ieee',
+                last_checked = NOW(),
+                last_updated = NOW()
+        """, tuple(value for row in batch for value in row))
+        conn.commit()
+        batch.clear()
+        if progress:
+            progress(processed)
 
-    return {
-        row['mac_prefix'].lower(): {
-            'vendor': row['vendor_name'],
-            'status': row['status']
-        }
-        for row in entries
-    }
+    try:
+        for prefix, vendor in parse_oui_csv(text_stream):
+            batch.append((prefix, vendor))
+            processed += 1
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        cursor.close()
+        conn.close()
+        invalidate_vendor_cache()
+
+    print(f"→ OUI registry import finished: {processed} assignments upserted.")
+    return processed
+
+
+# Vendor names by 24-bit prefix, in front of mac_vendors and the vendor API for
+# every lookup: a per-worker LRU, then the shared cache, then mac_vendors.
+# None marks a prefix the API does not know (or could not resolve); those
+# entries expire after VENDOR_CACHE_NEGATIVE_TTL. Expired LRU entries are still
+# served for VENDOR_CACHE_STALE_TTL seconds while a background thread rereads
+# them. Bulk changes (OUI import, restore) bump the 'vendors' version stamp,
+# which empties every worker's LRU.
+_vendor_cache = None
+_vendor_cache_version = {"seen": None}
+_vendor_cache_lock = threading.Lock()
+
+# What mac_vendors stores, and lookups show, for prefixes without a vendor
+VENDOR_NOT_FOUND = "not found"
+
+def _get_vendor_cache():
+    global _vendor_cache
+    with _vendor_cache_lock:
+        if _vendor_cache is None:
+            config = current_app.config if current_app else {}
+            _vendor_cache = TTLCache(
+                max_size=config.get("VENDOR_CACHE_SIZE", 10000),
+                ttl=config.get("VENDOR_CACHE_TTL", 3600),
+                negative_ttl=config.get("VENDOR_CACHE_NEGATIVE_TTL", 300),
+                stale_ttl=config.get("VENDOR_CACHE_STALE_TTL", 86400),
+            )
+        version = shared_cache.get_version("vendors")
+        if _vendor_cache_version["seen"] != version:
+            _vendor_cache.invalidate()
+            _vendor_cache_version["seen"] = version
+        return _vendor_cache
+
+def invalidate_vendor_cache():
+    """Make every worker drop its cached vendors and reload the IEEE registry."""
+    shared_cache.bump_version("vendors")
+
+def _share_vendors(vendors):
+    """Publish {prefix: vendor or None} to the other workers through the shared cache."""
+    cache = _get_vendor_cache()
+    found = {shared_cache.versioned_key("vendors", p): v for p, v in vendors.items() if v}
+    not_found = {shared_cache.versioned_key("vendors", p): None for p, v in vendors.items() if not v}
+    shared_cache.set_many(found, cache.ttl)
+    shared_cache.set_many(not_found, cache.negative_ttl)
+
+def get_vendor_cache_stats():
+    """Return size and hit/miss counters of this worker's vendor cache."""
+    return _get_vendor_cache().stats()
+
+def _mac_prefix(mac):
+    return mac.lower().replace(":", "").replace("-", "").replace(".", "")[:6]
+
+def _load_vendor_rows(prefixes):
+    """Read the mac_vendors rows for prefixes in one query, cache them and return {prefix: vendor or None}."""
+    placeholders = ", ".join(["%s"] * len(prefixes))
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT mac_prefix, vendor_name, status FROM mac_vendors WHERE mac_prefix IN ({placeholders})",
+                       tuple(prefixes))
+        vendors = {prefix.lower(): vendor if status == "found" else None for prefix, vendor, status in cursor.fetchall()}
+    finally:
+        cursor.close()
+        conn.close()
 
-def get_vendor_info(mac, insert_if_found=True):
-    """Get vendor info for a MAC address, optionally inserting into the database."""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-    prefix = mac.lower().replace(":", "").replace("-", "")[:6]
+    cache = _get_vendor_cache()
+    for prefix, vendor in vendors.items():
+        cache.set(prefix, vendor)
+    _share_vendors(vendors)
+    return vendors
 
-    print(f">>> Looking up MAC: {mac} → Prefix: {prefix}")
-    print("→ Searching in local database...")
-    cursor.execute("SELECT vendor_name, status FROM mac_vendors WHERE mac_prefix = %s", (prefix,))
-    row = cursor.fetchone()
+def _revalidate_vendors(prefixes):
+    """Reread stale prefixes from mac_vendors in a background thread."""
+    cache = _get_vendor_cache()
+    prefixes = cache.begin_refresh(prefixes)
+    if not prefixes:
+        return
 
-    if row:
-        print(f"✓ Found locally: {row['vendor_name']} (Status: {row['status']})")
-        cursor.close()
-        conn.close()
-        return {
-            "mac": mac,
-            "vendor": row['vendor_name'],
-            "source": "local",
-            "status": row['status']
-        }
+    def run():
+        try:
+            found = _load_vendor_rows(prefixes)
+            for prefix in prefixes:
+                if prefix not in found:
+                    cache.invalidate(prefix)
+        except Exception as e:
+            print(f"⚠️ Vendor cache revalidation failed: {e}")
+        finally:
+            cache.end_refresh(prefixes)
+
+    threading.Thread(target=run, name="vendor-cache-revalidate", daemon=True).start()
+
+def get_cached_vendors(prefixes):
+    """Return {prefix: vendor or None} for 24-bit prefixes, reading only cache misses from mac_vendors.
+
+    LRU misses are looked up in the shared cache, then in mac_vendors with one
+    query. Prefixes without a mac_vendors row are left out of the result; only
+    the API can resolve them (see get_vendor_info()).
+    """
+    cache = _get_vendor_cache()
+    vendors, missing, stale = {}, [], []
+    for prefix in set(prefixes):
+        state, vendor = cache.get(prefix)
+        if state == MISS:
+            missing.append(prefix)
+            continue
+        vendors[prefix] = vendor
+        if state == STALE:
+            stale.append(prefix)
+
+    if stale:
+        _revalidate_vendors(stale)
+    if missing:
+        keys = {shared_cache.versioned_key("vendors", prefix): prefix for prefix in missing}
+        for key, vendor in shared_cache.get_many(keys).items():
+            vendors[keys[key]] = vendor
+            cache.set(keys[key], vendor)
+        missing = [prefix for prefix in missing if prefix not in vendors]
+    if missing:
+        vendors.update(_load_vendor_rows(missing))
+    return vendors
+
+def get_vendor_info(mac):
+    """Get vendor info for a MAC address: IEEE registry, vendor cache and mac_vendors, then the API."""
+    prefix = _mac_prefix(mac)
+
+    vendor = lookup_oui(mac)
+    if vendor:
+        return {"mac": mac, "vendor": vendor, "source": "ieee", "status": "found"}
+
+    vendors = get_cached_vendors([prefix])
+    if prefix in vendors:
+        vendor = vendors[prefix]
+        return {"mac": mac, "vendor": vendor or VENDOR_NOT_FOUND, "source": "local",
+                "status": "found" if vendor else "not_found"}
 
+    print(f">>> Looking up MAC: {mac} → Prefix: {prefix}")
     print("✗ Not found locally, querying API...")
 
-    url_template = current_app.config.get("OUI_API_URL", "https://api.maclookup.app/v2/macs/{}")
-    api_key = current_app.config.get("OUI_API_KEY", "")
-    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-
     try:
-        url = url_template.format(prefix)
-        print(f"→ Querying API: {url}")
-        response = requests.get(url, headers=headers)
-        vendor_to_insert = "not found"
-        status_to_insert = "not_found"
-        result = { "mac": mac, "vendor": "", "source": "api", "status": "not_found" } # Default
-
-        if response.status_code == 200:
-            data = response.json()
-            vendor = data.get("company", "").strip()
-
-            if vendor:
-                print(f"✓ Found from API: {vendor}")
-                vendor_to_insert = vendor
-                status_to_insert = "found"
-                result = { "mac": mac, "vendor": vendor, "source": "api", "status": "found" }
-            else:
-                print("⚠️ API returned empty company field. Treating as not_found.")
-                # vendor/status/result remain default 'not_found'
-        elif response.status_code == 404:
-            print("✗ API returned 404 - vendor not found.")
-            # vendor/status/result remain default 'not_found'
-        else:
-            print(f"✗ API error: {response.status_code}")
-            # Don't insert on other API errors
-            result = {"mac": mac, "vendor": "", "error": f"API error: {response.status_code}"}
-            # Skip insert logic below by returning early
-            cursor.close()
-            conn.close()
-            return result
-            
-        # Insert/Update logic (Based on original code's comments, it always inserts/updates)
-        # Using 'insert_if_found' flag is ignored as per original code's apparent behaviour
-        cursor.execute("""
-            INSERT INTO mac_vendors (mac_prefix, vendor_name, status, last_checked, last_updated)
-            VALUES (%s, %s, %s, NOW(), NOW())
-            ON DUPLICATE KEY UPDATE
-                vendor_name = VALUES(vendor_name),
-                status = VALUES(status),
-                last_checked = NOW(),
-                last_updated = NOW()
-        """, (prefix, vendor_to_insert, status_to_insert))
-        print(f"→ Inserted/Updated '{vendor_to_insert}' ({status_to_insert}) for {prefix} → rowcount: {cursor.rowcount}")
-        conn.commit()
-        return result
-
-    except Exception as e:
-        print(f"✗ Exception while querying API: {e}")
+        try:
+            vendor = oui_api.fetch_vendor(prefix, *_oui_api_settings())
+        finally:
+            record_oui_api_usage(1)
+    except (oui_api.ApiError, oui_api.RateLimited, requests.exceptions.RequestException) as e:
+        print(f"✗ {e}")
+        # Not cached: only an answer from the API says the prefix is unknown
         return {"mac": mac, "vendor": "", "error": str(e)}
 
+    if vendor:
+        print(f"✓ Found from API: {vendor}")
+    else:
+        print("✗ API does not know this prefix - vendor not found.")
+    store_vendor_results([(prefix, vendor)])
+    return {"mac": mac, "vendor": vendor or VENDOR_NOT_FOUND, "source": "api",
+            "status": "found" if vendor else "not_found"}
+
+def get_mac_enrichment(mac_addresses):
+    """Resolve user and vendor info for many MACs at once.
+
+    Runs one users query for the whole batch and returns
+    {lowercase_mac: {'user': row or None, 'vendor': name or None}}. Vendors come
+    from the IEEE registry and the vendor cache, which reads mac_vendors only
+    for prefixes it has not seen. The API is never called here: MACs whose
+    prefix is unknown locally get vendor None for a job to look up.
+    """
+    macs = sorted({mac.lower().replace(":", "").replace("-", "") for mac in mac_addresses if mac})
+    if not macs:
+        return {}
+
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        placeholders = ", ".join(["%s"] * len(macs))
+        cursor.execute(f"SELECT * FROM users WHERE mac_address IN ({placeholders})", tuple(macs))
+        users = {row['mac_address'].lower(): row for row in cursor.fetchall()}
     finally:
-        if conn and conn.is_connected():
-             if cursor:
-                 cursor.close()
-             conn.close()
+        cursor.close()
+        conn.close()
+
+    # MA-M/MA-S assignments are more specific than the 24-bit prefix rows
+    registry = {mac: lookup_oui(mac) for mac in macs}
+    vendors = get_cached_vendors({mac[:6] for mac in macs if not registry[mac]})
+
+    result = {}
+    for mac in macs:
+        vendor = registry[mac]
+        if vendor is None and mac[:6] in vendors:
+            vendor = vendors[mac[:6]] or VENDOR_NOT_FOUND
+        result[mac] = {'user': users.get(mac), 'vendor': vendor}
+    return result
 
 def lookup_mac_verbose(mac):
     """Look up vendor info for a MAC with verbose output, querying API if needed."""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
     output = []
-    prefix = mac.lower().replace(":", "").replace("-", "")[:6]
+    prefix = _mac_prefix(mac)
 
-    output.append(f"🔍 Searching local database for prefix: {prefix}...")
-
-    cursor.execute("SELECT vendor_name, status FROM mac_vendors WHERE mac_prefix = %s", (prefix,))
-    row = cursor.fetchone()
+    output.append("📚 Searching the imported IEEE OUI registry...")
+    vendor = lookup_oui(mac)
+    if vendor:
+        output.append(f"✅ Found in IEEE registry: {vendor}")
+        return "\n".join(output)
 
-    if row:
-        output.append(f"✅ Found locally: {row['vendor_name']} (status: {row['status']})")
-        cursor.close()
-        conn.close()
+    output.append(f"🔍 Searching vendor cache and local database for prefix: {prefix}...")
+    vendors = get_cached_vendors([prefix])
+    if prefix in vendors:
+        if vendors[prefix]:
+            output.append(f"✅ Found locally: {vendors[prefix]}")
+        else:
+            output.append("✅ Known locally: the API has no vendor for this prefix.")
         return "\n".join(output)
 
     output.append("❌ Not found locally.")
     output.append("🌐 Querying API...")
 
-    url_template = current_app.config.get("OUI_API_URL", "https://api.maclookup.app/v2/macs/{}")
-    api_key = current_app.config.get("OUI_API_KEY", "")
-    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-
     try:
-        url = url_template.format(prefix)
-        response = requests.get(url, headers=headers, timeout=10) # Add timeout
-
-        if response.status_code == 200:
-            data = response.json()
-            vendor_name = data.get("company", "").strip()
-            if vendor_name:
-                output.append(f"✅ Found via API: {vendor_name}")
-                output.append("💾 Inserting into local database...")
-
-                # Original code here used simple INSERT, not INSERT...ON DUPLICATE KEY UPDATE
-                # Consider changing to match get_vendor_info for consistency if desired.
-                # Sticking to original code for now.
-                cursor.execute("""
-                    INSERT INTO mac_vendors (mac_prefix, vendor_name, status, last_checked, last_updated)
-                    VALUES (%s, %s, 'found', NOW(), NOW())
-                """, (prefix, vendor_name))
-                conn.commit()
-                output.append(f"  → Inserted '{vendor_name}' for {prefix} (rowcount: {cursor.rowcount})")
-            else:
-                output.append("⚠️ API responded but no vendor name found. Not inserting.")
-                # Consider inserting 'not_found' status here for consistency? Original code doesn't.
-        elif response.status_code == 404:
-            output.append("❌ Not found via API (404). Not inserting.")
-            # Consider inserting 'not_found' status here for consistency? Original code doesn't.
+        try:
+            vendor_name = oui_api.fetch_vendor(prefix, *_oui_api_settings())
+        finally:
+            record_oui_api_usage(1)
+
+        if vendor_name:
+            output.append(f"✅ Found via API: {vendor_name}")
+            output.append("💾 Inserting into local database...")
+            store_vendor_results([(prefix, vendor_name)])
+            output.append(f"  → Stored '{vendor_name}' for {prefix}")
         else:
-            output.append(f"❌ API returned unexpected status: {response.status_code}")
+            output.append("❌ Not found via API. Not inserting.")
+            _get_vendor_cache().set(prefix, None)
 
+    except (oui_api.ApiError, oui_api.RateLimited) as e:
+        output.append(f"❌ {e}")
     except requests.exceptions.RequestException as e:
          output.append(f"🚨 Network/Request Exception during API request: {e}")
     except Exception as e:
         output.append(f"🚨 Unexpected Exception during API request: {e}")
-        conn.rollback() # Rollback on general exception during DB interaction phase
 
-    finally:
-        if conn and conn.is_connected():
-             if cursor:
-                 cursor.close()
-             conn.close()
-             
     return "\n".join(output)
 
-def refresh_vendors():
-    """Fetch and cache vendor info for unknown MAC prefixes using the API."""
+def _oui_api_settings():
+    """Return (url_template, api_key, rate) for oui_api.fetch_vendor() from the app config."""
+    return (
+        current_app.config.get("OUI_API_URL", "https://api.maclookup.app/v2/macs/{}"),
+        current_app.config.get("OUI_API_KEY", ""),
+        int(current_app.config.get("OUI_API_LIMIT_PER_SEC", 2)),
+    )
+
+def get_oui_api_usage(day=None):
+    """Return the number of OUI API calls recorded for a UTC day (today by default)."""
+    day = day or datetime.now(timezone.utc).date()
     conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
+    cursor = conn.cursor()
+    cursor.execute("SELECT requests FROM oui_api_usage WHERE day = %s", (day,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return row[0] if row else 0
+
+def record_oui_api_usage(count, day=None):
+    """Add count OUI API calls to the persistent per-day usage counter."""
+    if count <= 0:
+        return
+    day = day or datetime.now(timezone.utc).date()
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO oui_api_usage (day, requests) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE requests = requests + VALUES(requests)
+    """, (day, count))
+    conn.commit()
+    cursor.close()
+    conn.close()
 
-    # Fetch all distinct 6-char prefixes from users table that are NOT in mac_vendors table
+def get_unknown_vendor_prefixes():
+    """Return the distinct 6-digit prefixes of users that have no mac_vendors row yet."""
+    conn = get_connection()
+    cursor = conn.cursor()
     cursor.execute("""
-        SELECT DISTINCT SUBSTRING(REPLACE(REPLACE(mac_address, ':', ''), '-', ''), 1, 6) AS mac_prefix
-        FROM users
-        WHERE SUBSTRING(REPLACE(REPLACE(mac_address, ':', ''), '-', ''), 1, 6) NOT IN (
-            SELECT mac_prefix FROM mac_vendors
-        )
+        SELECT DISTINCT LEFT(u.mac_address, 6) AS mac_prefix
+        FROM users u
+        LEFT JOIN mac_vendors m ON m.mac_prefix = LEFT(u.mac_address, 6)
+        WHERE m.mac_prefix IS NULL
     """)
-    prefixes = [row['mac_prefix'].lower() for row in cursor.fetchall() if row['mac_prefix']]
+    prefixes = [row[0].lower() for row in cursor.fetchall() if row[0]]
     cursor.close()
+    conn.close()
+    return prefixes
 
-    if not prefixes:
-        print("→ No unknown MAC prefixes found in users table to refresh.")
-        conn.close()
+def store_vendor_results(results):
+    """Upsert a batch of (prefix, vendor_name_or_None) API results into mac_vendors in one statement."""
+    if not results:
         return
-
-    print(f"→ Found {len(prefixes)} unknown prefixes to look up.")
-
-    url_template = current_app.config.get("OUI_API_URL", "https://api.maclookup.app/v2/macs/{}")
-    api_key = current_app.config.get("OUI_API_KEY", "")
-    rate_limit = int(current_app.config.get("OUI_API_LIMIT_PER_SEC", 2))
-    daily_limit = int(current_app.config.get("OUI_API_DAILY_LIMIT", 10000))
-
-    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
-
-    inserted_count = 0
-    skipped_count = 0
-    error_count = 0
-    cursor = conn.cursor() # Use standard cursor for inserts
-
-    for i, prefix in enumerate(prefixes):
-        if inserted_count >= daily_limit:
-            print(f"🛑 Reached daily API limit ({daily_limit}). Stopping refresh.")
-            break
-
-        print(f" ({i+1}/{len(prefixes)}) Looking up prefix: {prefix}")
-
-        try:
-            url = url_template.format(prefix)
-            response = requests.get(url, headers=headers, timeout=10)
-
-            vendor_name = "not found"
-            status = "not_found"
-
-            if response.status_code == 200:
-                data = response.json()
-                api_vendor = data.get("company", "").strip()
-                if api_vendor:
-                    vendor_name = api_vendor
-                    status = "found"
-                    print(f"  ✓ Found: {vendor_name}")
-                else:
-                    print(f"  ⚠️ API OK, but empty vendor for {prefix}. Marked as 'not found'.")
-            elif response.status_code == 404:
-                print(f"  ✗ Not found (404) for {prefix}.")
-            else:
-                print(f"  ❌ API error {response.status_code} for {prefix}, skipping insert.")
-                error_count += 1
-                time.sleep(1.0 / rate_limit)
-                continue
-
-            # Insert or Update logic matches get_vendor_info
-            cursor.execute("""
-                INSERT INTO mac_vendors (mac_prefix, vendor_name, status, last_checked, last_updated)
-                VALUES (%s, %s, %s, NOW(), NOW())
-                ON DUPLICATE KEY UPDATE
-                    vendor_name = VALUES(vendor_name),
-                    status = VALUES(status),
-                    last_checked = NOW(),
-                    last_updated = NOW()
-            """, (prefix, vendor_name, status))
-            conn.commit()
-            if cursor.rowcount > 0:
-                 inserted_count += 1
-                 print(f"  → Stored '{vendor_name}' ({status}) for {prefix}")
-            else:
-                 print(f"  → No change recorded for {prefix}.")
-                 skipped_count +=1
-
-        except requests.exceptions.RequestException as e:
-            print(f"  🚨 Network/Request Exception fetching vendor for {prefix}: {e}")
-            error_count += 1
-        except Exception as e:
-            print(f"  🚨 Unexpected Exception fetching vendor for {prefix}: {e}")
-            error_count += 1
-            conn.rollback()
-
-        time.sleep(1.0 / rate_limit)
-
-    print(f"→ Refresh finished. Inserted/Updated: {inserted_count}, Skipped/No change: {skipped_count}, Errors: {error_count}")
+    rows = [(prefix, vendor or "not found", "found" if vendor else "not_found") for prefix, vendor in results]
+    placeholders = ", ".join(["(%s, %s, %s, NOW(), NOW())"] * len(rows))
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        INSERT INTO mac_vendors (mac_prefix, vendor_name, status, last_checked, last_updated)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE
+            vendor_name = VALUES(vendor_name),
+            status = VALUES(status),
+            last_checked = NOW(),
+            last_updated = NOW()
+    """, tuple(value for row in rows for value in row))
+    conn.commit()
     cursor.close()
     conn.close()
 
+    cache = _get_vendor_cache()
+    for prefix, vendor in results:
+        cache.set(prefix, vendor)
+    _share_vendors(dict(results))
+    # Changes the stats enrichment; unlike "vendors" this leaves the vendor caches alone
+    shared_cache.bump_version("vendor_rows")
+
 
 # ------------------------------
 # Authentication Log Functions
 # ------------------------------
 
-def get_latest_auth_logs(reply_type=None, limit=5, time_range=None, offset=0):
-    """Retrieve recent authentication logs filtered by reply type and time range."""
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
+TIME_RANGE_DELTAS = {
+    'last_minute': timedelta(minutes=1),
+    'last_5_minutes': timedelta(minutes=5),
+    'last_10_minutes': timedelta(minutes=10),
+    'last_hour': timedelta(hours=1),
+    'last_6_hours': timedelta(hours=6),
+    'last_12_hours': timedelta(hours=12),
+    'last_day': timedelta(days=1),
+    'last_30_days': timedelta(days=30)
+}
+
+def _auth_log_filters(reply_type=None, time_range=None):
+    """Build the WHERE clauses and params shared by the auth_logs queries."""
     tz_str = current_app.config.get('APP_TIMEZONE', 'UTC')
     try:
         app_tz = pytz.timezone(tz_str)
@@ -544,8 +1016,7 @@ def get_latest_auth_logs(reply_type=None, limit=5, time_range=None, offset=0):
         app_tz = pytz.utc
     now = datetime.now(app_tz)
     print(f"🕒 Using timezone: {tz_str} → Now: {now.isoformat()}")
-    
-    query_base = "SELECT * FROM auth_logs"
+
     filters = []
     params = []
 
@@ -557,82 +1028,229 @@ def get_latest_auth_logs(reply_type=None, limit=5, time_range=None, offset=0):
         filters.append("reply = %s")
         params.append(reply_type)
 
-    time_filter_dt = None
     if time_range and time_range != 'all':
-        delta = {
-            'last_minute': timedelta(minutes=1),
-            'last_5_minutes': timedelta(minutes=5),
-            'last_10_minutes': timedelta(minutes=10),
-            'last_hour': timedelta(hours=1),
-            'last_6_hours': timedelta(hours=6),
-            'last_12_hours': timedelta(hours=12),
-            'last_day': timedelta(days=1),
-            'last_30_days': timedelta(days=30)
-        }.get(time_range)
-
+        delta = TIME_RANGE_DELTAS.get(time_range)
         if delta:
             time_filter_dt = now - delta
             print(f"🕒 Filtering logs after: {time_filter_dt.isoformat()}")
             filters.append("timestamp >= %s")
             params.append(time_filter_dt)
 
+    return filters, params
+
+def _auth_log_page_filters(reply_type=None, time_range=None):
+    """_auth_log_filters() for the paginated cards: rows without a timestamp have no
+    keyset position (nor a cursor encoding), so the pages and their totals skip them."""
+    filters, params = _auth_log_filters(reply_type, time_range)
+    filters.append("timestamp IS NOT NULL")
+    return filters, params
+
+def encode_log_cursor(entry):
+    """Encode the (timestamp, id) position of an auth_logs row as a URL-safe cursor."""
+    return f"{entry['timestamp'].strftime('%Y%m%d%H%M%S%f')}-{entry['id']}"
+
+def decode_log_cursor(cursor_value):
+    """Decode a cursor from encode_log_cursor(), returning (timestamp, id) or None."""
+    try:
+        ts_part, id_part = cursor_value.split('-', 1)
+        return datetime.strptime(ts_part, '%Y%m%d%H%M%S%f'), int(id_part)
+    except (AttributeError, ValueError):
+        return None
+
+def get_latest_auth_logs(reply_type=None, limit=5, time_range=None, offset=0, cursor=None, direction='next'):
+    """Retrieve recent authentication logs filtered by reply type and time range.
+
+    When a cursor is given, rows are located by seeking on (timestamp, id)
+    instead of OFFSET: direction 'next' returns rows older than the cursor,
+    'prev' returns rows newer than it. Results are always newest first.
+    """
+    conn = get_read_connection()
+    db_cursor = conn.cursor(dictionary=True)
+
+    filters, params = _auth_log_page_filters(reply_type, time_range)
+    order = "DESC"
+
+    position = decode_log_cursor(cursor) if cursor else None
+    if position:
+        ts, log_id = position
+        op = ">" if direction == 'prev' else "<"
+        filters.append(f"(timestamp {op} %s OR (timestamp = %s AND id {op} %s))")
+        params.extend([ts, ts, log_id])
+        if direction == 'prev':
+            order = "ASC"
+        offset = 0
+
+    query_base = "SELECT * FROM auth_logs"
     if filters:
         query_base += " WHERE " + " AND ".join(filters)
 
-    query_base += " ORDER BY timestamp DESC LIMIT %s OFFSET %s"
+    query_base += f" ORDER BY timestamp {order}, id {order} LIMIT %s OFFSET %s"
     params.extend([limit, offset])
 
-    cursor.execute(query_base, tuple(params))
+    db_cursor.execute(query_base, tuple(params))
+    logs = db_cursor.fetchall()
+    db_cursor.close()
+    conn.close()
+
+    if order == "ASC":
+        logs.reverse()
+    return logs
+
+def get_auth_logs_page(reply_type=None, limit=25, time_range=None, cursor=None, direction='next', total=None):
+    """Fetch one keyset-paginated page of auth logs.
+
+    Returns a dict with the page entries, 'next_cursor' (older rows) and
+    'prev_cursor' (newer rows), each None when there is nothing in that
+    direction. total may be None, 'approx' (optimizer estimate) or 'exact'.
+    """
+    position = decode_log_cursor(cursor) if cursor else None
+    if position is None:
+        direction = 'next'
+
+    # Fetch one extra row to learn whether another page exists past this one.
+    rows = get_latest_auth_logs(reply_type, limit + 1, time_range,
+                                cursor=cursor if position else None, direction=direction)
+
+    if direction == 'prev':
+        has_newer = len(rows) > limit
+        entries = rows[-limit:] if has_newer else rows
+        has_older = True
+    else:
+        has_older = len(rows) > limit
+        entries = rows[:limit]
+        has_newer = position is not None
+
+    page = {
+        "entries": entries,
+        "next_cursor": encode_log_cursor(entries[-1]) if entries and has_older else None,
+        "prev_cursor": encode_log_cursor(entries[0]) if entries and has_newer else None,
+        "total": None,
+        "total_is_estimate": total == 'approx'
+    }
+
+    if total == 'exact':
+        page["total"] = count_auth_logs(reply_type, time_range)
+    elif total == 'approx':
+        page["total"] = estimate_auth_logs(reply_type, time_range)
+
+    return page
+
+def get_max_auth_log_id():
+    """Return the newest auth_logs id, or 0 when the table is empty."""
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM auth_logs")
+    max_id = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return max_id
+
+def get_auth_logs_after(last_id, limit=500):
+    """Return auth_logs rows with id greater than last_id, oldest first."""
+    conn = get_read_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM auth_logs WHERE id > %s ORDER BY id LIMIT %s", (last_id, limit))
     logs = cursor.fetchall()
     cursor.close()
     conn.close()
     return logs
 
-def count_auth_logs(reply_type=None, time_range=None):
-    """Count the number of authentication logs matching a reply type and time."""
-    conn = get_connection()
+def get_auth_logs_version(time_range=None):
+    """Return a cheap fingerprint of the auth log rows visible for a time range.
+
+    Combines the newest auth_logs id and the oldest id still inside the time
+    window; both are index lookups, so this is suitable for computing ETags on
+    every poll. Changes to users and vendors do not show here; stats_etag()
+    adds their shared cache version stamps.
+    """
+    conn = get_read_connection()
     cursor = conn.cursor()
 
-    tz_str = current_app.config.get('APP_TIMEZONE', 'UTC')
-    try:
-        app_tz = pytz.timezone(tz_str)
-    except pytz.UnknownTimeZoneError:
-        print(f"Warning: Unknown timezone '{tz_str}', falling back to UTC.")
-        app_tz = pytz.utc
-    now = datetime.now(app_tz)
-    print(f"🕒 Using timezone: {tz_str} → Now: {now.isoformat()}")
-    
-    query_base = "SELECT COUNT(*) FROM auth_logs"
-    filters = []
-    params = []
+    filters, params = _auth_log_filters(None, time_range)
+    window_query = "SELECT id FROM auth_logs"
+    if filters:
+        window_query += " WHERE " + " AND ".join(filters)
+    window_query += " ORDER BY timestamp, id LIMIT 1"
+
+    cursor.execute(f"""
+        SELECT
+            (SELECT MAX(id) FROM auth_logs),
+            ({window_query})
+    """, tuple(params))
+    version = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return tuple(version)
 
-    if reply_type == 'Accept-Fallback':
-        filters.append("reply = 'Access-Accept'")
-        filters.append("result LIKE %s")
-        params.append('%Fallback%')
-    elif reply_type is not None:
-        filters.append("reply = %s")
-        params.append(reply_type)
+def iter_auth_logs(start=None, end=None, after_id=0, chunk_size=5000):
+    """Yield auth_logs rows (oldest id first) with start <= timestamp < end and id > after_id.
 
-    time_filter_dt = None
-    if time_range and time_range != 'all':
-        delta = {
-            'last_minute': timedelta(minutes=1),
-            'last_5_minutes': timedelta(minutes=5),
-            'last_10_minutes': timedelta(minutes=10),
-            'last_hour': timedelta(hours=1),
-            'last_6_hours': timedelta(hours=6),
-            'last_12_hours': timedelta(hours=12),
-            'last_day': timedelta(days=1),
-            'last_30_days': timedelta(days=30)
-        }.get(time_range)
+    Rows are read in id-ordered chunks, each streamed from an unbuffered
+    cursor in its own short autocommit statement, so no long-lived read view
+    or transaction is held against the RADIUS inserts.
+    """
+    conn = get_read_connection(request_scoped=False)
+    try:
+        # Bound the id range with two seeks on idx_auth_logs_ts
+        cursor = conn.cursor()
+        last_id = after_id or 0
+        max_id = None
+        if start:
+            cursor.execute("SELECT id FROM auth_logs WHERE timestamp >= %s ORDER BY timestamp, id LIMIT 1", (start,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            last_id = max(last_id, row[0] - 1)
+        if end:
+            cursor.execute("SELECT id FROM auth_logs WHERE timestamp < %s ORDER BY timestamp DESC, id DESC LIMIT 1", (end,))
+            row = cursor.fetchone()
+            if row is None:
+                return
+            max_id = row[0]
+        cursor.close()
 
-        if delta:
-            time_filter_dt = now - delta
-            print(f"🕒 Filtering logs after: {time_filter_dt.isoformat()}")
+        filters = ["id > %s"]
+        base_params = []
+        if max_id is not None:
+            filters.append("id <= %s")
+            base_params.append(max_id)
+        if start:
             filters.append("timestamp >= %s")
-            params.append(time_filter_dt)
+            base_params.append(start)
+        if end:
+            filters.append("timestamp < %s")
+            base_params.append(end)
+        query = ("SELECT id, timestamp, mac_address, reply, result FROM auth_logs WHERE "
+                 + " AND ".join(filters) + " ORDER BY id LIMIT %s")
+
+        while True:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            count = 0
+            try:
+                cursor.execute(query, tuple([last_id] + base_params + [chunk_size]))
+                for row in cursor:
+                    count += 1
+                    last_id = row["id"]
+                    yield row
+            finally:
+                # The client may disconnect mid-chunk, leaving unread rows on the cursor
+                try:
+                    cursor.close()
+                except mysql.connector.Error:
+                    pass
+            if count < chunk_size:
+                break
+    finally:
+        conn.close()
+
+def count_auth_logs(reply_type=None, time_range=None):
+    """Count the number of authentication logs matching a reply type and time."""
+    conn = get_read_connection()
+    cursor = conn.cursor()
 
+    filters, params = _auth_log_page_filters(reply_type, time_range)
+
+    query_base = "SELECT COUNT(*) FROM auth_logs"
     if filters:
         query_base += " WHERE " + " AND ".join(filters)
 
@@ -642,6 +1260,28 @@ def count_auth_logs(reply_type=None, time_range=None):
     conn.close()
     return count
 
+def estimate_auth_logs(reply_type=None, time_range=None):
+    """Estimate matching auth logs from the optimizer's row estimate, without scanning."""
+    conn = get_read_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    filters, params = _auth_log_page_filters(reply_type, time_range)
+
+    query_base = "EXPLAIN SELECT id FROM auth_logs"
+    if filters:
+        query_base += " WHERE " + " AND ".join(filters)
+
+    try:
+        cursor.execute(query_base, tuple(params))
+        plan = cursor.fetchall()
+        return int(plan[0]['rows'] or 0) if plan else 0
+    except Exception as e:
+        print(f"⚠️ Could not estimate auth_logs rows: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
 
 # ------------------------------
 # Summary Functions
@@ -673,120 +1313,345 @@ def get_summary_counts():
     return total_users, total_groups
 
 def get_database_stats():
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    stats = {}
+    """Return database size and key table row estimates, derived from get_table_stats()."""
+    table_stats = get_table_stats() or []
+    by_name = {t["table"]: t for t in table_stats}
 
-    # Get total size of the database
-    cursor.execute("""
-        SELECT table_schema AS db_name,
-               ROUND(SUM(data_length + index_length) / 1024 / 1024, 2) AS total_mb
-        FROM information_schema.tables
-        WHERE table_schema = DATABASE()
-        GROUP BY table_schema
-    """)
-    row = cursor.fetchone()
-    stats["total_size_mb"] = row[1] if row else 0
+    def rows_for(table):
+        entry = by_name.get(table)
+        if not entry:
+            return 0
+        return entry["exact_rows"] if entry["exact_rows"] is not None else entry["estimated_rows"]
 
-    # Optional: count total rows in key tables
-    cursor.execute("SELECT COUNT(*) FROM auth_logs")
-    stats["auth_logs_count"] = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM users")
-    stats["users_count"] = cursor.fetchone()[0]
-
-    conn.close()
-    return stats
+    return {
+        "total_size_mb": round(sum(t["data_mb"] + t["index_mb"] for t in table_stats), 2),
+        "auth_logs_count": rows_for("auth_logs"),
+        "users_count": rows_for("users"),
+    }
 
 # ------------------------------
 # Maintenance Functions
 # ------------------------------
 
-def clear_auth_logs():
-    """Route to clear authentication logs."""
-    from db_connection import get_connection
+def clear_auth_logs(progress=None, should_stop=None, chunk_size=10000):
+    """Delete all authentication logs in chunks of chunk_size rows, returning the number deleted.
+
+    Each chunk is its own transaction, so the purge never holds one huge undo
+    log. progress is called with the running total after every chunk; if
+    should_stop() returns True the purge stops between chunks.
+    """
     conn = get_connection()
     cursor = conn.cursor()
+    deleted = 0
     try:
-        cursor.execute("DELETE FROM auth_logs")
-        conn.commit()
-        flash("✅ Authentication logs cleared.", "success")
-    except Exception as e:
-        conn.rollback()
-        flash(f"❌ Error clearing logs: {e}", "error")
+        while not (should_stop and should_stop()):
+            cursor.execute("DELETE FROM auth_logs ORDER BY id LIMIT %s", (chunk_size,))
+            conn.commit()
+            deleted += cursor.rowcount
+            if progress:
+                progress(deleted)
+            if cursor.rowcount < chunk_size:
+                break
     finally:
         cursor.close()
         conn.close()
-    return redirect(url_for("maintenance.maintenance_page"))
+        invalidate_table_stats_cache()
+    print(f"→ Cleared {deleted} authentication log rows.")
+    return deleted
+
+def _mysqldump(args, progress=None, chunk_size=64 * 1024):
+    """Run mysqldump with the given trailing args and yield its stdout in chunks.
+
+    mysqldump connects with the DB_* settings itself; no pooled connection is
+    held while it runs.
+    """
+    host = os.getenv('DB_HOST', 'localhost')
+    port = os.getenv('DB_PORT', '3306')
+    user = os.getenv('DB_USER', '')
+    password = os.getenv('DB_PASSWORD', '')
+    db_name = os.getenv('DB_NAME', '')
+
+    cmd = ["mysqldump", "-h", host, "-P", str(port), "-u", user,
+           "--single-transaction", "--quick", "--routines", "--triggers", db_name] + args
+    # Pass the password through the environment so it does not show up in ps
+    env = dict(os.environ, MYSQL_PWD=password)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    finished = False
+    try:
+        while True:
+            chunk = proc.stdout.read(chunk_size)
+            if not chunk:
+                break
+            if progress:
+                marker = chunk.rfind(b"-- Dumping data for table `")
+                table = None
+                if marker != -1:
+                    start = marker + len(b"-- Dumping data for table `")
+                    table = chunk[start:chunk.find(b"`", start)].decode("utf-8", "replace")
+                progress(len(chunk), table)
+            yield chunk
+        finished = True
+    finally:
+        proc.stdout.close()
+        if not finished:
+            # The client went away mid-download; stop the dump
+            proc.kill()
+        returncode = proc.wait()
+        stderr = proc.stderr.read().decode("utf-8", "replace").strip()
+        proc.stderr.close()
+
+    if returncode != 0:
+        raise Exception(f"❌ Backup failed (mysqldump exit {returncode}): {stderr}")
+
+def iter_database_backup(tables=None, exclude_tables=None, auth_logs_days=None, progress=None):
+    """Yield a SQL dump of the database as bytes, streamed from mysqldump without temporary files.
+
+    tables limits the dump to those tables; exclude_tables skips tables.
+    auth_logs_days, if set, dumps only the last N days of auth_logs. progress
+    is called with (bytes_in_chunk, table_being_dumped_or_None).
+    """
+    if not shutil.which("mysqldump"):
+        raise Exception("❌ 'mysqldump' command not found. Please install mariadb-client or mysql-client.")
 
-def backup_database():
-    """Create a SQL backup of the entire database and return the path to the file."""
     conn = get_connection()
     db_name = conn.database
-    user = conn.user
-    password = conn._password
-    host = conn.server_host if hasattr(conn, 'server_host') else 'localhost'
     conn.close()
 
-    # Check if mysqldump exists
-    if not shutil.which("mysqldump"):
-        raise Exception("❌ 'mysqldump' command not found. Please install mariadb-client or mysql-client.")
-
-    backup_file = "backup.sql"
+    tables = list(tables or [])
+    exclude_tables = set(exclude_tables or [])
+    wants_auth_logs = "auth_logs" not in exclude_tables and (not tables or "auth_logs" in tables)
+    limit_auth_logs = auth_logs_days is not None and wants_auth_logs
+    if limit_auth_logs:
+        exclude_tables.add("auth_logs")
+
+    main_tables = [table for table in tables if table not in exclude_tables]
+    if main_tables or not tables:
+        args = [f"--ignore-table={db_name}.{table}" for table in sorted(exclude_tables)] + main_tables
+        yield from _mysqldump(args, progress)
+
+    if limit_auth_logs:
+        cutoff = (datetime.utcnow() - timedelta(days=int(auth_logs_days))).strftime("%Y-%m-%d %H:%M:%S")
+        yield from _mysqldump(["auth_logs", "--skip-routines", f"--where=timestamp >= '{cutoff}'"], progress)
+
+def estimate_backup_size(tables=None, exclude_tables=None):
+    """Estimate the dump size in bytes from information_schema data lengths."""
+    stats = get_table_stats() or []
+    exclude_tables = set(exclude_tables or [])
+    return sum(
+        int(t["data_mb"] * 1024 * 1024) for t in stats
+        if t["table"] not in exclude_tables and (not tables or t["table"] in tables)
+    )
 
+RESTORE_BATCH_STATEMENTS = 200
+RESTORE_BATCH_BYTES = 16 * 1024 * 1024
+_RESTORE_TABLE_RE = re.compile(r"^(?:INSERT|REPLACE)\s+(?:IGNORE\s+)?INTO\s+`?([^`\s(]+)", re.IGNORECASE)
+
+def iter_sql_text(stream, chunk_size=1024 * 1024):
+    """Yield decoded text chunks from a binary .sql or .sql.gz stream (detected by the gzip magic bytes)."""
+    magic = stream.read(2)
+    stream.seek(0)
+    if magic == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
     try:
-        with open(backup_file, "w") as f:
-            subprocess.run(
-                ["mysqldump", "-h", host, "-u", user, f"-p{password}", db_name],
-                stdout=f,
-                check=True
-            )
-    except subprocess.CalledProcessError as e:
-        raise Exception(f"❌ Backup failed: {e}")
-
-    return backup_file
-
-def restore_database(sql_content):
-    """Restore the database from raw SQL content (as string)."""
-    conn = get_connection()
+        while True:
+            chunk = text.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        # Leave the underlying upload open for the caller
+        text.detach()
+
+def restore_database(stream, progress=None, should_stop=None):
+    """Restore the database from a binary .sql or .sql.gz stream, executing statements as they are parsed.
+
+    Statements run in batched transactions with foreign_key_checks and
+    unique_checks relaxed. progress is called after each batch with
+    (statements_executed, table_being_restored_or_None); if should_stop()
+    returns True between batches the open batch is rolled back and the restore
+    stops. Returns the number of statements committed. Raises on the first
+    failing statement; earlier batches stay committed.
+    """
+    # A connection of its own: the session settings below must not leak into the request's queries
+    conn = get_connection(request_scoped=False)
     cursor = conn.cursor()
+    executed = 0
+    batch_statements = 0
+    batch_bytes = 0
+    table = None
     try:
-        for statement in sql_content.split(';'):
-            stmt = statement.strip()
-            if stmt:
-                cursor.execute(stmt)
+        # Pooled connections autocommit; turn that off so each batch is one transaction
+        cursor.execute("SET SESSION autocommit = 0")
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        cursor.execute("SET SESSION unique_checks = 0")
+        for statement in iter_sql_statements(iter_sql_text(stream)):
+            cursor.execute(statement)
+            if cursor.with_rows:
+                cursor.fetchall()
+            batch_statements += 1
+            batch_bytes += len(statement)
+            match = _RESTORE_TABLE_RE.match(statement)
+            if match:
+                table = match.group(1)
+            if batch_statements >= RESTORE_BATCH_STATEMENTS or batch_bytes >= RESTORE_BATCH_BYTES:
+                if should_stop and should_stop():
+                    conn.rollback()
+                    print(f"⏹️ Restore stopped after {executed} statements.")
+                    return executed
+                conn.commit()
+                executed += batch_statements
+                batch_statements = batch_bytes = 0
+                if progress:
+                    progress(executed, table)
         conn.commit()
-        flash("✅ Database restored successfully.", "success")
+        executed += batch_statements
+        if progress:
+            progress(executed, table)
+        print(f"✅ Database restored: {executed} statements executed.")
+        return executed
     except Exception as e:
         conn.rollback()
-        flash(f"❌ Error restoring database: {e}", "error")
+        print(f"❌ Restore failed at statement {executed + batch_statements}: {e}")
+        raise Exception(f"Error at statement {executed + batch_statements} "
+                        f"(the first {executed} statements were committed): {e}") from e
     finally:
+        try:
+            cursor.execute("SET SESSION foreign_key_checks = 1")
+            cursor.execute("SET SESSION unique_checks = 1")
+            cursor.execute("SET SESSION autocommit = 1")
+        except mysql.connector.Error:
+            pass
         cursor.close()
         conn.close()
-    return redirect(url_for("maintenance.maintenance_page"))
+        invalidate_table_stats_cache()
+        invalidate_user_cache()
+        invalidate_auth_user_cache()
+        invalidate_vendor_cache()
+
+# Cached result of get_table_stats(), refreshed after TABLE_STATS_CACHE_TTL seconds
+# or when the 'table_stats' version stamp changes (e.g. an exact count finished in another worker)
+_table_stats_cache = {"stats": None, "loaded_at": 0.0, "version": None}
+_table_stats_lock = threading.Lock()
+
+def invalidate_table_stats_cache():
+    """Make every worker reload the table statistics on its next read."""
+    shared_cache.bump_version("table_stats")
 
 def get_table_stats():
-    """Return a dictionary of table names and their row counts."""
+    """Return per-table statistics from information_schema estimates (no table scans).
+
+    Each entry holds the estimated row count, the last persisted exact count (if
+    any), data/index/free sizes in MB, a fragmentation percentage and the
+    partition breakdown for partitioned tables.
+    """
+    ttl = current_app.config.get("TABLE_STATS_CACHE_TTL", 300) if current_app else 300
+
+    version = shared_cache.get_version("table_stats")
+    with _table_stats_lock:
+        cached = _table_stats_cache["stats"]
+        if (cached is not None and _table_stats_cache["version"] == version
+                and time.monotonic() - _table_stats_cache["loaded_at"] < ttl):
+            return cached
+
+    conn = get_read_connection()
+    cursor = conn.cursor(dictionary=True)
+
+    try:
+        cursor.execute("""
+            SELECT table_name AS name, table_rows, data_length, index_length, data_free
+            FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND table_type = 'BASE TABLE'
+            ORDER BY table_name
+        """)
+        tables = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT table_name AS name, partition_name, partition_method,
+                   partition_description, table_rows, data_length, index_length
+            FROM information_schema.partitions
+            WHERE table_schema = DATABASE() AND partition_name IS NOT NULL
+            ORDER BY table_name, partition_ordinal_position
+        """)
+        partitions = {}
+        for row in cursor.fetchall():
+            partitions.setdefault(row["name"], []).append({
+                "name": row["partition_name"],
+                "method": row["partition_method"],
+                "description": row["partition_description"],
+                "estimated_rows": int(row["table_rows"] or 0),
+                "size_mb": round(((row["data_length"] or 0) + (row["index_length"] or 0)) / 1024 / 1024, 2),
+            })
+
+        exact_counts = {}
+        try:
+            cursor.execute("SELECT table_name, row_count, counted_at FROM table_row_counts")
+            exact_counts = {row["table_name"]: row for row in cursor.fetchall()}
+        except mysql.connector.Error:
+            # table_row_counts is created by migration; older schemas simply have no exact counts
+            pass
+
+        stats = []
+        for row in tables:
+            data_length = int(row["data_length"] or 0)
+            index_length = int(row["index_length"] or 0)
+            data_free = int(row["data_free"] or 0)
+            allocated = data_length + index_length + data_free
+            exact = exact_counts.get(row["name"])
+            stats.append({
+                "table": row["name"],
+                "estimated_rows": int(row["table_rows"] or 0),
+                "exact_rows": exact["row_count"] if exact else None,
+                "counted_at": exact["counted_at"] if exact else None,
+                "data_mb": round(data_length / 1024 / 1024, 2),
+                "index_mb": round(index_length / 1024 / 1024, 2),
+                "free_mb": round(data_free / 1024 / 1024, 2),
+                "fragmentation_pct": round(data_free * 100.0 / allocated, 1) if allocated else 0.0,
+                "partitions": partitions.get(row["name"], []),
+            })
+    except Exception as e:
+        print(f"❌ Error retrieving table stats: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _table_stats_lock:
+        _table_stats_cache.update(stats=stats, loaded_at=time.monotonic(), version=version)
+    return stats
+
+def count_table_rows_exact(progress=None, should_stop=None):
+    """Run COUNT(*) on every table and persist the results in table_row_counts. Returns the tables counted.
+
+    Runs as the count_table_rows background job. progress(counted, total, table)
+    is called before each table; once should_stop() returns True no further
+    tables are counted.
+    """
     conn = get_connection()
     cursor = conn.cursor()
+    counted = 0
 
     try:
         cursor.execute("SHOW TABLES")
         tables = [row[0] for row in cursor.fetchall()]
-        stats = {}
 
         for table in tables:
+            if should_stop and should_stop():
+                break
+            if progress:
+                progress(counted, len(tables), table)
             cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
             count = cursor.fetchone()[0]
-            stats[table] = count
-
-        return stats
-    except Exception as e:
-        print(f"❌ Error retrieving table stats: {e}")
-        return None
+            cursor.execute("""
+                INSERT INTO table_row_counts (table_name, row_count, counted_at)
+                VALUES (%s, %s, NOW())
+                ON DUPLICATE KEY UPDATE row_count = VALUES(row_count), counted_at = NOW()
+            """, (table, count))
+            conn.commit()
+            counted += 1
+            print(f"→ Exact row count for {table}: {count}")
     finally:
         cursor.close()
         conn.close()
-        
-
+        invalidate_table_stats_cache()
+    return counted
@@ -1,12 +1,32 @@
 """
-Database migration script for RadMac: ensures auth_users table exists.
+Database migration script for RadMac: applies the ordered SQL files in migrations/.
 Run this at container startup before launching the app.
+
+Each migration is a file named NNNN_description.sql. Applied migrations are
+recorded in schema_migrations together with a checksum of the file, so a
+start-up against a current schema costs one query. A migration may declare the
+existing tables it rewrites with a "-- tables: a, b" header line; only those
+tables are backed up before it runs. ALTER statements should request
+ALGORITHM=INPLACE, LOCK=NONE and are retried with the server's default
+algorithm if that is not possible for the operation.
 """
 from db_connection import get_connection
+import mysql.connector
+import hashlib
 import os
+import re
 import subprocess
+import time
 from datetime import datetime
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_LOCK_NAME = "radmac_schema_migration"
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("DB_MIGRATION_LOCK_TIMEOUT", "600"))
+BACKUP_BEFORE_MIGRATION = os.getenv("DB_MIGRATION_BACKUP", "true").lower() == "true"
+
+# ER_ALTER_OPERATION_NOT_SUPPORTED / ER_ALTER_OPERATION_NOT_SUPPORTED_REASON
+ONLINE_DDL_UNSUPPORTED_ERRNOS = (1845, 1846)
+
 CREATE_SCHEMA_VERSION_SQL = """
 CREATE TABLE IF NOT EXISTS schema_version (
     version INT NOT NULL,
@@ -14,17 +34,47 @@ CREATE TABLE IF NOT EXISTS schema_version (
 );
 """
 
-CREATE_AUTH_USERS_SQL = """
-CREATE TABLE IF NOT EXISTS auth_users (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    username VARCHAR(64) NOT NULL UNIQUE,
-    password_hash VARCHAR(255) NOT NULL,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+CREATE_SCHEMA_MIGRATIONS_SQL = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT NOT NULL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    checksum CHAR(64) NOT NULL,
+    duration_ms INT DEFAULT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 """
 
+def load_migrations(directory=MIGRATIONS_DIR):
+    """Return the migration files in version order as dicts of version, name, checksum, sql and tables."""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = re.match(r"^(\d+)_(.+)\.sql$", filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), "rb") as f:
+            raw = f.read()
+        sql = raw.decode("utf-8")
+        tables_match = re.search(r"^--\s*tables:\s*(.+)$", sql, re.MULTILINE)
+        migrations.append({
+            "version": int(match.group(1)),
+            "name": filename,
+            "checksum": hashlib.sha256(raw).hexdigest(),
+            "sql": sql,
+            "tables": [t.strip() for t in tables_match.group(1).split(",") if t.strip()] if tables_match else [],
+        })
+
+    versions = [m["version"] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+def split_statements(sql):
+    """Split a migration file into statements. Migrations keep one statement per ';'-terminated block."""
+    lines = [line for line in sql.splitlines() if not line.strip().startswith("--")]
+    return [stmt.strip() for stmt in "\n".join(lines).split(";") if stmt.strip()]
+
 def get_current_schema_version(cursor):
-    """Get the current schema version from the database."""
+    """Get the current schema version from the legacy schema_version table."""
     try:
         cursor.execute("SELECT version FROM schema_version ORDER BY applied_at DESC LIMIT 1")
         row = cursor.fetchone()
@@ -34,24 +84,44 @@ def get_current_schema_version(cursor):
         return 0
 
 def set_schema_version(cursor, version):
-    """Set the current schema version in the database."""
+    """Set the current schema version in the legacy schema_version table."""
     cursor.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
 
-def backup_database():
-    """Create a backup of the database before migration."""
+def get_applied_migrations(cursor):
+    """Return {version: checksum} for applied migrations, or None if the table does not exist yet."""
+    try:
+        cursor.execute("SELECT version, checksum FROM schema_migrations")
+        return {row[0]: row[1] for row in cursor.fetchall()}
+    except mysql.connector.Error:
+        return None
+
+def pending_migrations(migrations, applied):
+    """Return migrations not yet applied, warning about files whose checksum has changed."""
+    pending = []
+    for migration in migrations:
+        checksum = applied.get(migration["version"])
+        if checksum is None:
+            pending.append(migration)
+        elif checksum != migration["checksum"]:
+            print(f"[DB MIGRATION] Warning: {migration['name']} was modified after it was applied (checksum mismatch).")
+    return pending
+
+def backup_database(tables=None):
+    """Create a backup of the given tables (or the whole database) before migration."""
     try:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_filename = f"/app/logs/db_backup_pre_migration_{timestamp}.sql"
-        
+        scope = "_".join(tables) if tables else "full"
+        backup_filename = f"/app/logs/db_backup_pre_migration_{timestamp}_{scope}.sql"
+
         # Ensure logs directory exists
         os.makedirs("/app/logs", exist_ok=True)
-        
+
         # Get database connection details from environment
         db_host = os.environ.get('DB_HOST', 'localhost')
         db_user = os.environ.get('DB_USER', 'root')
         db_password = os.environ.get('DB_PASSWORD', '')
         db_name = os.environ.get('DB_NAME', 'radmac')
-        
+
         # Create mysqldump command
         cmd = [
             'mysqldump',
@@ -59,80 +129,116 @@ def backup_database():
             f'--user={db_user}',
             f'--password={db_password}',
             '--single-transaction',
-            '--routines',
-            '--triggers',
             db_name
         ]
-        
+        if tables:
+            cmd.extend(tables)
+        else:
+            cmd[-1:-1] = ['--routines', '--triggers']
+
         # Execute backup
         with open(backup_filename, 'w') as backup_file:
             result = subprocess.run(cmd, stdout=backup_file, stderr=subprocess.PIPE, text=True)
-            
+
         if result.returncode == 0:
             print(f"[DB BACKUP] Database backup created: {backup_filename}")
             return True
         else:
             print(f"[DB BACKUP] Warning: Backup failed: {result.stderr}")
             return False
-            
+
     except Exception as e:
         print(f"[DB BACKUP] Warning: Could not create backup: {e}")
         return False
 
+def execute_ddl(cursor, statement):
+    """Execute a statement, retrying without ALGORITHM/LOCK clauses if online DDL is not possible."""
+    try:
+        cursor.execute(statement)
+    except mysql.connector.Error as e:
+        if e.errno not in ONLINE_DDL_UNSUPPORTED_ERRNOS:
+            raise
+        fallback = re.sub(r",?\s*(ALGORITHM|LOCK)\s*=\s*\w+", "", statement, flags=re.IGNORECASE)
+        print(f"[DB MIGRATION] Online DDL not available ({e.msg}); retrying with the default algorithm.")
+        cursor.execute(fallback)
+
+def apply_migration(conn, cursor, migration):
+    """Apply one migration file and record it in schema_migrations."""
+    print(f"[DB MIGRATION] Applying {migration['name']}...")
+    if BACKUP_BEFORE_MIGRATION and migration["tables"]:
+        backup_database(migration["tables"])
+
+    started = time.monotonic()
+    for statement in split_statements(migration["sql"]):
+        execute_ddl(cursor, statement)
+    duration_ms = int((time.monotonic() - started) * 1000)
+
+    cursor.execute(
+        "INSERT INTO schema_migrations (version, name, checksum, duration_ms) VALUES (%s, %s, %s, %s)",
+        (migration["version"], migration["name"], migration["checksum"], duration_ms)
+    )
+    set_schema_version(cursor, migration["version"])
+    conn.commit()
+    print(f"[DB MIGRATION] Applied {migration['name']} in {duration_ms} ms.")
+
+def baseline_from_schema_version(conn, cursor, migrations):
+    """Record migrations already covered by the legacy schema_version number as applied."""
+    legacy_version = get_current_schema_version(cursor)
+    for migration in migrations:
+        if migration["version"] <= legacy_version:
+            cursor.execute(
+                "INSERT IGNORE INTO schema_migrations (version, name, checksum) VALUES (%s, %s, %s)",
+                (migration["version"], migration["name"], migration["checksum"])
+            )
+    conn.commit()
+    if legacy_version:
+        print(f"[DB MIGRATION] Recorded migrations up to legacy schema version {legacy_version} as applied.")
+
 def migrate():
-    # Define the current schema version
-    CURRENT_VERSION = 1
-    
     try:
-        conn = get_connection()
+        migrations = load_migrations()
+        conn = get_connection(request_scoped=False)
         cursor = conn.cursor()
-        
-        # Ensure schema_version table exists first
-        cursor.execute(CREATE_SCHEMA_VERSION_SQL)
-        conn.commit()
-        
-        # Check current version
-        current_version = get_current_schema_version(cursor)
-        print(f"[DB MIGRATION] Current schema version: {current_version}")
-        
-        if current_version >= CURRENT_VERSION:
-            print(f"[DB MIGRATION] Schema is up to date (version {current_version}). No migration needed.")
+
+        # Fast path: one query when every migration file is already applied
+        applied = get_applied_migrations(cursor)
+        if applied is not None and not pending_migrations(migrations, applied):
+            print(f"[DB MIGRATION] Schema is up to date (version {max(applied, default=0)}). No migration needed.")
+            cursor.close()
+            conn.close()
+            return
+
+        # Only one app replica migrates at a time; the others wait, then see a current schema
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            print("[DB MIGRATION] Warning: Timed out waiting for the migration lock. Skipping migration.")
             cursor.close()
             conn.close()
             return
-        
-        # Create backup before migration
-        print(f"[DB MIGRATION] Upgrading schema from version {current_version} to {CURRENT_VERSION}")
-        backup_database()
-        
-        # Apply migrations based on current version
-        if current_version < 1:
-            # Migration to version 1: ensure auth_users table and column size
-            cursor.execute(CREATE_AUTH_USERS_SQL)
-            try:
-                cursor.execute("ALTER TABLE auth_users MODIFY COLUMN password_hash VARCHAR(255) NOT NULL")
-                print("[DB MIGRATION] auth_users.password_hash column updated to VARCHAR(255).")
-            except Exception as e:
-                # Column might already be correct size or table might not exist yet
-                pass
-            
-            set_schema_version(cursor, 1)
-            print("[DB MIGRATION] Upgraded to schema version 1.")
-        
-        # Future migrations would go here:
-        # if current_version < 2:
-        #     # Migration to version 2
-        #     cursor.execute("ALTER TABLE users ADD COLUMN new_field VARCHAR(255)")
-        #     set_schema_version(cursor, 2)
-        #     print("[DB MIGRATION] Upgraded to schema version 2.")
-        
-        conn.commit()
+
+        try:
+            cursor.execute(CREATE_SCHEMA_VERSION_SQL)
+            cursor.execute(CREATE_SCHEMA_MIGRATIONS_SQL)
+            conn.commit()
+
+            if applied is None:
+                baseline_from_schema_version(conn, cursor, migrations)
+
+            pending = pending_migrations(migrations, get_applied_migrations(cursor) or {})
+            if not pending:
+                print("[DB MIGRATION] Schema was migrated by another instance. No migration needed.")
+            for migration in pending:
+                apply_migration(conn, cursor, migration)
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+            cursor.fetchone()
+
         cursor.close()
         conn.close()
         print("[DB MIGRATION] Migration completed successfully.")
-        
+
     except Exception as e:
-        print(f"[DB MIGRATION] Warning: Could not connect to database: {e}")
+        print(f"[DB MIGRATION] Warning: Migration failed: {e}")
         print("[DB MIGRATION] Skipping migration - database may not be ready yet.")
         # Don't exit with error code, let the app start anyway
 
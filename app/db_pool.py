@@ -0,0 +1,179 @@
+"""
+Instrumented MySQL connection pool with bounded overflow and a wait queue.
+
+mysql.connector's MySQLConnectionPool fails at once when every connection is
+checked out. InstrumentedPool instead opens up to `overflow` temporary
+connections, then queues up to `max_waiters` callers for a returned
+connection until `timeout`, and records checkouts, wait times, exhaustion
+events and connection ages for /health and /metrics.
+"""
+import os
+import threading
+import time
+import weakref
+
+import mysql.connector
+from mysql.connector import errors, pooling
+
+# Upper bounds (ms) of the checkout wait histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+def default_pool_size(default_threads=8):
+    """Size a worker's pool for every thread that can hold a connection at once.
+
+    That is one per gunicorn thread (GUNICORN_THREADS), one per background job
+    thread (JOB_WORKER_THREADS) and two for the auth log poller and cache
+    revalidation, capped at mysql.connector's pool limit. DB_POOL_SIZE
+    overrides the calculation.
+    """
+    if os.getenv('DB_POOL_SIZE'):
+        size = int(os.getenv('DB_POOL_SIZE'))
+    else:
+        size = int(os.getenv('GUNICORN_THREADS', default_threads)) + int(os.getenv('JOB_WORKER_THREADS', 2)) + 2
+    return max(1, min(size, pooling.CNX_POOL_MAXSIZE))
+
+class _OverflowConnection:
+    """A connection opened beyond pool_size while the pool is exhausted; close() disconnects it."""
+
+    def __init__(self, conn, pool):
+        self._cnx = conn
+        self._pool = pool
+
+    def close(self):
+        if self._cnx is None:
+            return
+        try:
+            self._cnx.close()
+        finally:
+            self._cnx = None
+            self._pool._release(overflow=True)
+
+    def __getattr__(self, name):
+        return getattr(self._cnx, name)
+
+class InstrumentedPool(pooling.MySQLConnectionPool):
+
+    def __init__(self, overflow=0, timeout=5.0, max_waiters=16, **config):
+        self.overflow = overflow
+        self.timeout = timeout
+        self.max_waiters = max_waiters
+        self._connect_config = {key: value for key, value in config.items() if not key.startswith('pool_')}
+        self._available = threading.Condition()
+        self._connections = weakref.WeakKeyDictionary()  # raw connection -> first seen (monotonic)
+        self._stats = {
+            "checked_out": 0, "peak_checked_out": 0, "overflow_in_use": 0, "overflow_opened": 0,
+            "waiting": 0, "checkouts": 0, "returned": 0, "exhausted": 0, "last_exhausted_at": None,
+            "timeouts": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0,
+        }
+        self._wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        super().__init__(**config)
+
+    def get_connection(self):
+        """Check out a connection, opening an overflow connection or waiting for one when the pool is empty."""
+        started = time.monotonic()
+        exhausted = False
+        while True:
+            returned = self._stats["returned"]
+            try:
+                conn = super().get_connection()
+                break
+            except errors.PoolError:
+                pass
+
+            with self._available:
+                if not exhausted:
+                    exhausted = True
+                    self._stats["exhausted"] += 1
+                    self._stats["last_exhausted_at"] = time.time()
+                if self._stats["returned"] != returned:
+                    continue  # a connection came back meanwhile
+                use_overflow = self._stats["overflow_in_use"] < self.overflow
+                if use_overflow:
+                    self._stats["overflow_in_use"] += 1
+                else:
+                    remaining = started + self.timeout - time.monotonic()
+                    if self._stats["waiting"] >= self.max_waiters:
+                        self._stats["rejected"] += 1
+                        raise errors.PoolError(f"Pool {self.pool_name} exhausted and {self.max_waiters} callers already waiting")
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise errors.PoolError(f"Timed out after {self.timeout}s waiting for a connection from pool {self.pool_name}")
+                    self._stats["waiting"] += 1
+                    try:
+                        self._available.wait(remaining)
+                    finally:
+                        self._stats["waiting"] -= 1
+                    continue
+
+            try:
+                conn = _OverflowConnection(mysql.connector.connect(**self._connect_config), self)
+            except Exception:
+                with self._available:
+                    self._stats["overflow_in_use"] -= 1
+                    self._available.notify()
+                raise
+            with self._available:
+                self._stats["overflow_opened"] += 1
+            break
+
+        self._record_checkout(conn, time.monotonic() - started)
+        return conn
+
+    def add_connection(self, cnx=None):
+        # Called without cnx while the pool fills, and with it when a checked-out connection is closed
+        super().add_connection(cnx)
+        if cnx is not None:
+            self._release()
+
+    def _release(self, overflow=False):
+        with self._available:
+            self._stats["checked_out"] -= 1
+            self._stats["returned"] += 1
+            if overflow:
+                self._stats["overflow_in_use"] -= 1
+            self._available.notify()
+
+    def _record_checkout(self, conn, wait):
+        raw = getattr(conn, "_cnx", None) or conn
+        bucket = next((i for i, limit in enumerate(WAIT_BUCKETS_MS) if wait * 1000 <= limit), len(WAIT_BUCKETS_MS))
+        with self._available:
+            stats = self._stats
+            stats["checked_out"] += 1
+            stats["peak_checked_out"] = max(stats["peak_checked_out"], stats["checked_out"])
+            stats["checkouts"] += 1
+            stats["total_wait"] += wait
+            stats["max_wait"] = max(stats["max_wait"], wait)
+            self._wait_histogram[bucket] += 1
+            if raw not in self._connections:
+                self._connections[raw] = time.monotonic()
+
+    def stats(self):
+        """Return a JSON-ready snapshot of the pool's counters."""
+        now = time.monotonic()
+        with self._available:
+            stats = dict(self._stats)
+            histogram = list(self._wait_histogram)
+            ages = [now - seen for seen in self._connections.values()]
+        labels = [f"<={limit}ms" for limit in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+        return {
+            "pool_size": self.pool_size,
+            "checked_out": stats["checked_out"],
+            "peak_checked_out": stats["peak_checked_out"],
+            "overflow_limit": self.overflow,
+            "overflow_in_use": stats["overflow_in_use"],
+            "overflow_opened": stats["overflow_opened"],
+            "waiting": stats["waiting"],
+            "max_waiters": self.max_waiters,
+            "checkouts": stats["checkouts"],
+            "exhausted": stats["exhausted"],
+            "last_exhausted_at": stats["last_exhausted_at"],
+            "timeouts": stats["timeouts"],
+            "rejected": stats["rejected"],
+            "avg_wait_ms": round(stats["total_wait"] * 1000 / stats["checkouts"], 2) if stats["checkouts"] else 0.0,
+            "max_wait_ms": round(stats["max_wait"] * 1000, 2),
+            "wait_ms_histogram": dict(zip(labels, histogram)),
+            "connection_age_seconds": {
+                "oldest": round(max(ages), 1) if ages else None,
+                "average": round(sum(ages) / len(ages), 1) if ages else None,
+            },
+        }
@@ -0,0 +1,341 @@
+"""
+Persistent background jobs for long-running web actions.
+
+Jobs are rows in the jobs table, so every gunicorn worker sees them and they
+outlive the request that queued them. Each worker runs JOB_WORKER_THREADS
+threads that claim queued jobs, heartbeat while a job runs and requeue jobs
+whose worker stopped heartbeating (for example after a worker was recycled).
+Jobs queued with local=True (they read a file from this container) are only
+claimed by workers on the same host.
+Handlers get a JobContext to report progress and to notice cancellation.
+"""
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+
+from flask import current_app
+
+from db_connection import get_connection
+from db_interface import clear_auth_logs, restore_database, get_vendor_info, count_table_rows_exact, import_users_csv
+from vendor_refresh import run_vendor_refresh
+
+WORKER_THREADS = int(os.getenv('JOB_WORKER_THREADS', 2))
+POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 2))
+STALE_AFTER = int(os.getenv('JOB_STALE_AFTER', 60))
+MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+FILES_DIR = os.getenv('JOB_FILES_DIR', '/tmp/radmac_jobs')
+HEARTBEAT_INTERVAL = 10
+HOSTNAME = socket.gethostname()
+PROGRESS_INTERVAL = 1.0
+
+_handlers = {}
+_wakeup = threading.Event()
+_workers_lock = threading.Lock()
+_workers = []
+
+class JobContext:
+    """Handed to a job handler: its id and params, progress reporting and cancellation state."""
+
+    def __init__(self, job_id, params):
+        self.id = job_id
+        self.params = params
+        self.progress_fields = {}
+        self._last_write = 0.0
+        self._cancelled = threading.Event()
+
+    def progress(self, **fields):
+        """Merge fields into the job's progress, written to the jobs table at most once a second."""
+        self.progress_fields.update(fields)
+        now = time.monotonic()
+        if now - self._last_write >= PROGRESS_INTERVAL:
+            self._last_write = now
+            _execute("UPDATE jobs SET progress = %s, heartbeat_at = NOW() WHERE id = %s",
+                     (json.dumps(self.progress_fields, default=str), self.id))
+
+    def is_cancelled(self):
+        """Return True once cancellation of this job was requested."""
+        return self._cancelled.is_set()
+
+def job_handler(job_type):
+    """Register handler(ctx, **params) for jobs of job_type. The return value becomes the job result."""
+    def decorator(func):
+        _handlers[job_type] = func
+        return func
+    return decorator
+
+def _execute(query, params=()):
+    # Never the request-scoped connection: a handler may be inside a transaction on it
+    # (e.g. a restore), which committing the job row would commit early
+    conn = get_connection(request_scoped=False)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        cursor.close()
+        conn.close()
+
+def _serialize(row):
+    job = dict(row)
+    for field in ("params", "progress", "result"):
+        job[field] = json.loads(job[field]) if job.get(field) else None
+    for field in ("created_at", "started_at", "heartbeat_at", "finished_at"):
+        if job.get(field):
+            job[field] = job[field].isoformat()
+    job["cancel_requested"] = bool(job.get("cancel_requested"))
+    return job
+
+def enqueue(job_type, params=None, unique=False, local=False):
+    """Queue a job and return its id. With unique=True, return the id of a queued or running job of that type instead.
+
+    local=True restricts the job to workers on this host, for jobs that read
+    files under JOB_FILES_DIR.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if unique:
+            cursor.execute("""
+                SELECT id FROM jobs WHERE type = %s AND status IN ('queued', 'running') ORDER BY id LIMIT 1
+            """, (job_type,))
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+        cursor.execute("INSERT INTO jobs (type, params, host) VALUES (%s, %s, %s)",
+                       (job_type, json.dumps(params or {}), HOSTNAME if local else None))
+        conn.commit()
+        job_id = cursor.lastrowid
+    finally:
+        cursor.close()
+        conn.close()
+    print(f"→ Queued job #{job_id} ({job_type})")
+    _wakeup.set()
+    return job_id
+
+def get_job(job_id):
+    """Return a job as a JSON-ready dict, or None."""
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM jobs WHERE id = %s", (job_id,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return _serialize(row) if row else None
+
+def is_job_active(job_type):
+    """Return True while a job of job_type is queued or running in any worker."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM jobs WHERE type = %s AND status IN ('queued', 'running') LIMIT 1", (job_type,))
+    active = cursor.fetchone() is not None
+    cursor.close()
+    conn.close()
+    return active
+
+def list_jobs(limit=20):
+    """Return the most recent jobs, newest first."""
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT %s", (limit,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    return [_serialize(row) for row in rows]
+
+def cancel_job(job_id):
+    """Cancel a queued job, or ask a running one to stop. Returns False if the job already finished."""
+    if _execute("""
+        UPDATE jobs SET status = 'cancelled', finished_at = NOW() WHERE id = %s AND status = 'queued'
+    """, (job_id,)):
+        return True
+    return _execute("UPDATE jobs SET cancel_requested = 1 WHERE id = %s AND status = 'running'", (job_id,)) > 0
+
+def job_file_path(suffix=""):
+    """Return a fresh path under JOB_FILES_DIR for a file a job will read (e.g. an uploaded dump)."""
+    os.makedirs(FILES_DIR, exist_ok=True)
+    return os.path.join(FILES_DIR, f"{uuid.uuid4().hex}{suffix}")
+
+def _requeue_stale_jobs():
+    """Requeue running jobs whose worker stopped heartbeating; give up after MAX_ATTEMPTS."""
+    stale = "status = 'running' AND heartbeat_at < NOW() - INTERVAL %s SECOND"
+    _execute(f"""
+        UPDATE jobs SET status = 'cancelled', finished_at = NOW()
+        WHERE {stale} AND cancel_requested = 1
+    """, (STALE_AFTER,))
+    _execute(f"""
+        UPDATE jobs SET status = 'failed', error = 'Worker stopped responding', finished_at = NOW()
+        WHERE {stale} AND attempts >= %s
+    """, (STALE_AFTER, MAX_ATTEMPTS))
+    if _execute(f"UPDATE jobs SET status = 'queued', worker = NULL WHERE {stale}", (STALE_AFTER,)):
+        print("⚠️ Requeued background jobs whose worker stopped responding")
+
+def _claim_next_job(worker_id):
+    conn = get_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("""
+            SELECT id FROM jobs WHERE status = 'queued' AND (host IS NULL OR host = %s) ORDER BY id LIMIT 5
+        """, (HOSTNAME,))
+        for candidate in cursor.fetchall():
+            # Another worker may claim the same row first; only one UPDATE matches
+            cursor.execute("""
+                UPDATE jobs
+                SET status = 'running', worker = %s, attempts = attempts + 1,
+                    started_at = NOW(), heartbeat_at = NOW()
+                WHERE id = %s AND status = 'queued'
+            """, (worker_id, candidate["id"]))
+            conn.commit()
+            if cursor.rowcount == 1:
+                cursor.execute("SELECT id, type, params, progress FROM jobs WHERE id = %s", (candidate["id"],))
+                return cursor.fetchone()
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+def _heartbeat(ctx, done):
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            conn = get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("UPDATE jobs SET heartbeat_at = NOW() WHERE id = %s", (ctx.id,))
+                conn.commit()
+                cursor.execute("SELECT cancel_requested FROM jobs WHERE id = %s", (ctx.id,))
+                row = cursor.fetchone()
+            finally:
+                cursor.close()
+                conn.close()
+            if row and row[0]:
+                ctx._cancelled.set()
+        except Exception as e:
+            print(f"⚠️ Heartbeat for job #{ctx.id} failed: {e}")
+
+def _run_job(app, job, worker_id):
+    ctx = JobContext(job["id"], json.loads(job["params"] or "{}"))
+    ctx.progress_fields = json.loads(job["progress"] or "{}")
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(ctx, done), name=f"job-{ctx.id}-heartbeat", daemon=True)
+    heartbeat.start()
+
+    status, result, error = "done", None, None
+    print(f"→ Running job #{ctx.id} ({job['type']})")
+    try:
+        handler = _handlers.get(job["type"])
+        if handler is None:
+            raise Exception(f"No handler for job type '{job['type']}'")
+        with app.app_context():
+            result = handler(ctx, **ctx.params)
+        if ctx.is_cancelled():
+            status = "cancelled"
+    except Exception as e:
+        status, error = "failed", str(e)
+        print(f"❌ Job #{ctx.id} ({job['type']}) failed: {e}")
+    finally:
+        done.set()
+        heartbeat.join()
+
+    _execute("""
+        UPDATE jobs SET status = %s, progress = %s, result = %s, error = %s, finished_at = NOW()
+        WHERE id = %s AND worker = %s
+    """, (status, json.dumps(ctx.progress_fields, default=str), json.dumps(result, default=str), error,
+          ctx.id, worker_id))
+    print(f"→ Job #{ctx.id} ({job['type']}) {status}")
+
+def _worker_loop(app, worker_id):
+    last_requeue = 0.0
+    while True:
+        job = None
+        try:
+            if time.monotonic() - last_requeue > STALE_AFTER / 2:
+                last_requeue = time.monotonic()
+                _requeue_stale_jobs()
+            job = _claim_next_job(worker_id)
+        except Exception as e:
+            print(f"⚠️ Job queue unavailable: {e}")
+            time.sleep(POLL_INTERVAL * 5)
+            continue
+
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+        _run_job(app, job, worker_id)
+
+def start_job_workers(app, threads=WORKER_THREADS):
+    """Start this process's job worker threads (once per process)."""
+    with _workers_lock:
+        if _workers or threads <= 0:
+            return
+        worker_id = f"{HOSTNAME}:{os.getpid()}"
+        for i in range(threads):
+            thread = threading.Thread(target=_worker_loop, args=(app, worker_id), name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            _workers.append(thread)
+    print(f"✅ Started {threads} background job worker threads ({worker_id})")
+
+# ------------------------------
+# Job Handlers
+# ------------------------------
+
+@job_handler("refresh_vendors")
+def refresh_vendors_job(ctx):
+    return run_vendor_refresh(current_app.config, progress=lambda status: ctx.progress(**status),
+                              should_stop=ctx.is_cancelled)
+
+@job_handler("clear_auth_logs")
+def clear_auth_logs_job(ctx):
+    deleted = clear_auth_logs(progress=lambda count: ctx.progress(deleted=count), should_stop=ctx.is_cancelled)
+    return {"deleted": deleted}
+
+@job_handler("count_table_rows")
+def count_table_rows_job(ctx):
+    def progress(counted, total, table):
+        ctx.progress(counted=counted, total=total, table=table)
+
+    return {"tables": count_table_rows_exact(progress=progress, should_stop=ctx.is_cancelled)}
+
+@job_handler("restore_database")
+def restore_database_job(ctx, path, filename=None):
+    if not os.path.exists(path):
+        raise Exception("The uploaded file is no longer available; upload it again.")
+    total_bytes = os.path.getsize(path)
+    try:
+        with open(path, "rb") as f:
+            def progress(statements, table):
+                ctx.progress(statements=statements, table=table, position=f.tell(), total_bytes=total_bytes)
+
+            statements = restore_database(f, progress=progress, should_stop=ctx.is_cancelled)
+        return {"statements": statements, "filename": filename}
+    finally:
+        os.remove(path)
+
+@job_handler("import_users")
+def import_users_job(ctx, path, filename=None):
+    if not os.path.exists(path):
+        raise Exception("The uploaded file is no longer available; upload it again.")
+
+    def progress(summary):
+        ctx.progress(processed=summary["processed"], imported=summary["imported"], errors=len(summary["errors"]))
+
+    try:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            summary = import_users_csv(f, progress=progress)
+        return dict(summary, filename=filename)
+    finally:
+        os.remove(path)
+
+@job_handler("lookup_macs")
+def lookup_macs_job(ctx, macs):
+    results = {}
+    for i, mac in enumerate(macs):
+        if ctx.is_cancelled():
+            break
+        # get_vendor_info() goes through the vendor cache, so each prefix hits the API at most once
+        results[mac] = get_vendor_info(mac).get("vendor", "")
+        ctx.progress(processed=i + 1, total=len(macs))
+    return results
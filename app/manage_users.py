@@ -0,0 +1,55 @@
+"""
+Bulk user import/export for RadMac.
+
+    python manage_users.py import users.csv [--batch-size 1000]
+    python manage_users.py export [users.csv]
+
+The CSV format is mac,description,vlan with an optional header row. Imports
+upsert existing MACs; the target VLAN groups must already exist.
+"""
+import argparse
+import sys
+
+from db_interface import import_users_csv, iter_users_csv
+
+def run_import(path, batch_size):
+    def progress(summary):
+        print(f"[IMPORT] {summary['processed']} rows processed, {summary['imported']} imported, "
+              f"{len(summary['errors'])} errors", file=sys.stderr)
+
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        summary = import_users_csv(f, batch_size=batch_size, progress=progress)
+
+    for error in summary["errors"]:
+        print(f"[IMPORT] line {error['line']}: {error['error']}", file=sys.stderr)
+    print(f"[IMPORT] Done: {summary['imported']} of {summary['processed']} rows imported.", file=sys.stderr)
+    return 1 if summary["errors"] else 0
+
+def run_export(path):
+    out = open(path, 'w', newline='', encoding='utf-8') if path else sys.stdout
+    try:
+        for chunk in iter_users_csv():
+            out.write(chunk)
+    finally:
+        if path:
+            out.close()
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import/export RadMac users as CSV.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Upsert users from a mac,description,vlan CSV file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+
+    export_parser = commands.add_parser("export", help="Write all users as CSV (stdout by default)")
+    export_parser.add_argument("path", nargs="?")
+
+    args = parser.parse_args()
+    if args.command == "import":
+        return run_import(args.path, args.batch_size)
+    return run_export(args.path)
+
+if __name__ == "__main__":
+    sys.exit(main())
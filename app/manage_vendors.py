@@ -0,0 +1,55 @@
+"""
+MAC vendor maintenance for RadMac.
+
+    python manage_vendors.py import-oui oui.csv mam.csv oui36.csv [--batch-size 1000]
+    python manage_vendors.py refresh
+
+import-oui loads the IEEE MA-L, MA-M and MA-S registries (the CSV downloads
+from standards-oui.ieee.org) into mac_vendors, so vendor lookups work offline
+and the API is only queried for prefixes the registry does not cover. refresh
+resolves the remaining unknown user prefixes through the API in the foreground.
+"""
+import argparse
+import sys
+
+from config import app_config
+from db_interface import import_oui_registry
+from vendor_refresh import run_vendor_refresh
+
+def run_import_oui(paths, batch_size):
+    total = 0
+    for path in paths:
+        def progress(processed):
+            print(f"[OUI] {path}: {processed} assignments upserted", file=sys.stderr)
+
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            total += import_oui_registry(f, batch_size=batch_size, progress=progress)
+    print(f"[OUI] Done: {total} assignments imported from {len(paths)} file(s).", file=sys.stderr)
+    return 0
+
+def run_refresh():
+    def progress(status):
+        print(f"[REFRESH] {status['processed']}/{status['total']} prefixes, {status['api_calls']} API calls, "
+              f"{status['quota_remaining']} left today", file=sys.stderr)
+
+    config = {name: getattr(app_config, name) for name in dir(app_config) if name.isupper()}
+    status = run_vendor_refresh(config, progress=progress)
+    return 1 if not status or status.get("errors") else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the RadMac MAC vendor table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import-oui", help="Upsert IEEE MA-L/MA-M/MA-S registry CSV files")
+    import_parser.add_argument("paths", nargs="+")
+    import_parser.add_argument("--batch-size", type=int, default=1000)
+
+    commands.add_parser("refresh", help="Look up unknown user MAC prefixes through the OUI API")
+
+    args = parser.parse_args()
+    if args.command == "import-oui":
+        return run_import_oui(args.paths, args.batch_size)
+    return run_refresh()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+-- Web UI login accounts and a password_hash column wide enough for werkzeug hashes.
+-- tables: auth_users
+
+CREATE TABLE IF NOT EXISTS auth_users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    username VARCHAR(64) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+ALTER TABLE auth_users MODIFY COLUMN password_hash VARCHAR(255) NOT NULL;
@@ -0,0 +1,3 @@
+-- Index users.vlan_id for the per-group user counts.
+
+ALTER TABLE users ADD INDEX IF NOT EXISTS idx_users_vlan_id (vlan_id), ALGORITHM=INPLACE, LOCK=NONE;
@@ -0,0 +1,6 @@
+-- (timestamp, id) indexes for keyset pagination of auth_logs.
+
+ALTER TABLE auth_logs
+    ADD INDEX IF NOT EXISTS idx_auth_logs_reply_ts (reply, timestamp, id),
+    ADD INDEX IF NOT EXISTS idx_auth_logs_ts (timestamp, id),
+    ALGORITHM=INPLACE, LOCK=NONE;
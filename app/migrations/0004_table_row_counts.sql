@@ -0,0 +1,7 @@
+-- Persisted exact row counts for the maintenance page.
+
+CREATE TABLE IF NOT EXISTS table_row_counts (
+    table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    row_count BIGINT NOT NULL,
+    counted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,5 @@
+-- Indexes for the server-side filtered and sorted user list.
+
+ALTER TABLE users ADD INDEX IF NOT EXISTS idx_users_description (description), ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE mac_vendors ADD INDEX IF NOT EXISTS idx_mac_vendors_vendor_name (vendor_name), ALGORITHM=INPLACE, LOCK=NONE;
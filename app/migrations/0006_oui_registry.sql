@@ -0,0 +1,9 @@
+-- tables: mac_vendors
+-- Widen mac_vendors.mac_prefix for IEEE MA-M (28-bit, 7 hex digits) and MA-S
+-- (36-bit, 9 hex digits) assignments and record whether a row came from the
+-- IEEE registry import or an API lookup. Changing the column type needs a
+-- table copy, which is quick for mac_vendors.
+
+ALTER TABLE mac_vendors
+    MODIFY mac_prefix VARCHAR(9) NOT NULL CHECK (mac_prefix REGEXP '^[0-9A-Fa-f]{6}([0-9A-Fa-f]|[0-9A-Fa-f]{3})?$'),
+    ADD COLUMN IF NOT EXISTS source ENUM('api', 'ieee') NOT NULL DEFAULT 'api';
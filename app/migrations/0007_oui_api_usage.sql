@@ -0,0 +1,6 @@
+-- Per-day OUI API call counter, so OUI_API_DAILY_LIMIT holds across restarts.
+
+CREATE TABLE IF NOT EXISTS oui_api_usage (
+    day DATE NOT NULL PRIMARY KEY,
+    requests INT NOT NULL DEFAULT 0
+);
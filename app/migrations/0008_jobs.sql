@@ -0,0 +1,22 @@
+-- Persistent queue for long-running web actions (vendor refresh, restore,
+-- clearing auth_logs, API vendor lookups), claimed by worker threads in every
+-- app worker.
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    type VARCHAR(64) NOT NULL,
+    params TEXT,
+    status ENUM('queued', 'running', 'done', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+    progress TEXT,
+    result MEDIUMTEXT,
+    error TEXT,
+    cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    worker VARCHAR(128) DEFAULT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME DEFAULT NULL,
+    heartbeat_at DATETIME DEFAULT NULL,
+    finished_at DATETIME DEFAULT NULL,
+    INDEX idx_jobs_status (status, id),
+    INDEX idx_jobs_type_status (type, status)
+);
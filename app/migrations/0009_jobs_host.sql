@@ -0,0 +1,5 @@
+-- Jobs that read a file from the enqueuing container (uploaded restores) record
+-- its hostname, so only workers on that host claim them.
+
+ALTER TABLE jobs
+    ADD COLUMN IF NOT EXISTS host VARCHAR(255) DEFAULT NULL AFTER worker;
@@ -0,0 +1,4 @@
+-- The user list's vendor filter is a substring match on the joined vendor
+-- rows, which idx_mac_vendors_vendor_name cannot serve; drop the write overhead.
+
+ALTER TABLE mac_vendors DROP INDEX IF EXISTS idx_mac_vendors_vendor_name;
@@ -0,0 +1,98 @@
+"""
+HTTP client for the MAC vendor API (OUI_API_URL).
+
+Every lookup in a worker shares one keep-alive requests.Session and one token
+bucket, so interactive lookups and background refreshes together never exceed
+OUI_API_LIMIT_PER_SEC.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+REQUEST_TIMEOUT = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+class RateLimited(Exception):
+    """The API answered 429; retry_after is the number of seconds it asked us to wait."""
+    def __init__(self, retry_after):
+        super().__init__(f"API rate limit hit, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class ApiError(Exception):
+    """The API answered with an unexpected status code."""
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at `rate` tokens per second.
+
+    With the default capacity of one, acquire() spaces callers exactly
+    1/rate seconds apart, which uses the whole per-second budget without
+    ever bursting past it.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+        self.capacity = capacity
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        with self.lock:
+            now = time.monotonic()
+            # A full bucket lets `capacity` calls through back to back
+            slot = max(self.next_slot, now - (self.capacity - 1) * self.interval)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def pause(self, seconds):
+        """Hand out no tokens for the next `seconds` (e.g. after a 429)."""
+        with self.lock:
+            self.next_slot = max(self.next_slot, time.monotonic() + seconds)
+
+_bucket = TokenBucket(2)
+
+def get_rate_limiter(rate):
+    """Return the worker's shared token bucket, set to `rate` requests per second."""
+    _bucket.set_rate(rate)
+    return _bucket
+
+def get_session(pool_size=8):
+    """Return the worker's shared keep-alive session for API calls."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+def fetch_vendor(prefix, url_template, api_key="", rate=None):
+    """Query the API for a MAC prefix and return the vendor name, or None if the API does not know it.
+
+    Waits for a token first when rate is given. Raises RateLimited on HTTP 429,
+    ApiError on other unexpected statuses and requests exceptions on network errors.
+    """
+    if rate:
+        get_rate_limiter(rate).acquire()
+
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    response = get_session().get(url_template.format(prefix), headers=headers, timeout=REQUEST_TIMEOUT)
+
+    if response.status_code == 200:
+        return response.json().get("company", "").strip() or None
+    if response.status_code == 404:
+        return None
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After", "")
+        raise RateLimited(int(retry_after) if retry_after.isdigit() else 1)
+    raise ApiError(f"API error: {response.status_code}")
@@ -0,0 +1,236 @@
+"""
+Opt-in profiler of the SQL statements the app runs (QUERY_PROFILER=true).
+
+Statements are reduced to their shape (literals and placeholders replaced by
+?, IN lists and multi-row VALUES collapsed), and each shape gets a call count, total
+and max time and a latency histogram. The first time a shape takes longer than
+QUERY_PROFILER_THRESHOLD_MS it is EXPLAINed once, in a background thread, with
+the parameters of that call. Each worker publishes its profile to the shared
+cache every PUBLISH_INTERVAL seconds; the maintenance page merges them into a
+table of the most expensive shapes.
+
+    python query_profiler.py [--threshold-ms 50]
+
+runs the web UI's main read queries once against the configured database
+(e.g. a local MariaDB) and prints the report with the EXPLAIN output.
+"""
+import argparse
+import os
+import re
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import shared_cache
+from db_connection import add_query_listener, get_connection
+
+ENABLED = os.getenv('QUERY_PROFILER', 'false').lower() == 'true'
+THRESHOLD_MS = float(os.getenv('QUERY_PROFILER_THRESHOLD_MS', 200))
+MAX_SHAPES = 1000
+PUBLISH_INTERVAL = 10
+# A worker's published profile disappears this long after its last publish (e.g. once it was recycled)
+PROFILE_TTL = 3600
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 250, 500, 1000, 5000)
+KEY_PREFIX = "query_profile:"
+# Bumped by reset_query_profile(); workers drop their counters when it changes
+VERSION_NAMESPACE = "query_profile"
+EXPLAIN_IN_BACKGROUND = True
+
+_COMMENTS = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_STRINGS = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s")
+_IN_LISTS = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_ROWS = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+# Statements MariaDB can EXPLAIN without running them
+_EXPLAINABLE = re.compile(r"^(SELECT\b.*\bFROM\b|WITH\b|UPDATE\b|DELETE\b)", re.I | re.S)
+
+_shapes = {}  # shape -> counters, histogram and EXPLAIN result
+_lock = threading.Lock()
+_state = {"published_at": 0.0, "version": None}
+_local = threading.local()
+
+def normalize_query(statement):
+    """Return the shape of statement: literals and placeholders as ?, IN lists and VALUES rows collapsed."""
+    if isinstance(statement, bytes):
+        statement = statement.decode("utf-8", "replace")
+    shape = _COMMENTS.sub(" ", statement)
+    shape = _STRINGS.sub("?", shape)
+    shape = _PLACEHOLDERS.sub("?", shape)
+    shape = _NUMBERS.sub("?", shape)
+    shape = " ".join(shape.split())
+    shape = _IN_LISTS.sub("IN (?, ...)", shape)
+    return _ROWS.sub(r"\1, ...", shape)
+
+def _record_query(statement, params, duration):
+    if getattr(_local, "explaining", False):
+        return
+    shape = normalize_query(statement)
+    ms = duration * 1000
+    bucket = next((i for i, limit in enumerate(LATENCY_BUCKETS_MS) if ms <= limit), len(LATENCY_BUCKETS_MS))
+    explain = False
+    with _lock:
+        entry = _shapes.get(shape)
+        if entry is None:
+            if len(_shapes) >= MAX_SHAPES:
+                return
+            entry = _shapes[shape] = {"calls": 0, "total_ms": 0.0, "max_ms": 0.0, "slow_calls": 0,
+                                      "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1), "explain": None}
+        entry["calls"] += 1
+        entry["total_ms"] += ms
+        entry["max_ms"] = max(entry["max_ms"], ms)
+        entry["histogram"][bucket] += 1
+        if ms >= THRESHOLD_MS:
+            entry["slow_calls"] += 1
+            if entry["explain"] is None:
+                explain = bool(_EXPLAINABLE.match(shape))
+                entry["explain"] = {"state": "pending" if explain else "unsupported", "ms": round(ms, 1),
+                                    "at": time.time(), "rows": None, "error": None}
+    if explain:
+        if EXPLAIN_IN_BACKGROUND:
+            threading.Thread(target=_explain, args=(shape, statement, params), name="query-explain",
+                             daemon=True).start()
+        else:
+            _explain(shape, statement, params)
+    if time.monotonic() - _state["published_at"] >= PUBLISH_INTERVAL:
+        publish()
+
+def _explain(shape, statement, params):
+    """Capture EXPLAIN for one slow call of shape on a connection of its own."""
+    _local.explaining = True
+    conn = None
+    try:
+        conn = get_connection(request_scoped=False)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute(f"EXPLAIN {statement}", params)
+            rows = [{key: value.decode() if isinstance(value, bytes) else value for key, value in row.items()}
+                    for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        result = {"state": "done", "rows": rows}
+    except Exception as e:
+        print(f"⚠️ EXPLAIN failed for query shape {shape[:80]}: {e}")
+        result = {"state": "failed", "error": str(e)}
+    finally:
+        if conn is not None:
+            conn.close()
+        _local.explaining = False
+    with _lock:
+        entry = _shapes.get(shape)
+        if entry is not None and entry["explain"] is not None:
+            entry["explain"].update(result)
+
+def init_query_profiler():
+    """Start profiling this process's queries when QUERY_PROFILER is enabled."""
+    if ENABLED:
+        add_query_listener(_record_query)
+        print(f"🔬 Query profiler enabled (EXPLAIN above {THRESHOLD_MS:.0f}ms)")
+
+def publish():
+    """Write this worker's profile to the shared cache, first dropping it if the profile was reset."""
+    version = shared_cache.get_version(VERSION_NAMESPACE)
+    with _lock:
+        _state["published_at"] = time.monotonic()
+        if _state["version"] is not None and _state["version"] != version:
+            _shapes.clear()
+        _state["version"] = version
+        shapes = {shape: dict(entry, histogram=list(entry["histogram"]),
+                              explain=dict(entry["explain"]) if entry["explain"] else None)
+                  for shape, entry in _shapes.items()}
+    shared_cache.put(f"{KEY_PREFIX}{socket.gethostname()}:{os.getpid()}",
+                     {"version": version, "shapes": shapes}, PROFILE_TTL)
+
+def reset_query_profile():
+    """Clear the profile of every worker."""
+    shared_cache.bump_version(VERSION_NAMESPACE)
+    publish()
+
+def _histogram_percentile(histogram, pct):
+    # Upper bound of the bucket holding the pct-th call (None past the last bound)
+    target = pct / 100 * sum(histogram)
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if count and seen >= target:
+            return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+def get_query_profile(limit=20):
+    """Merge the profiles of all workers and return the limit shapes with the most total time."""
+    publish()
+    version = shared_cache.get_version(VERSION_NAMESPACE)
+    workers = [profile for profile in shared_cache.get_prefix(KEY_PREFIX).values() if profile["version"] == version]
+
+    merged = {}
+    for profile in workers:
+        for shape, entry in profile["shapes"].items():
+            total = merged.get(shape)
+            if total is None:
+                merged[shape] = dict(entry, histogram=list(entry["histogram"]))
+                continue
+            total["calls"] += entry["calls"]
+            total["total_ms"] += entry["total_ms"]
+            total["max_ms"] = max(total["max_ms"], entry["max_ms"])
+            total["slow_calls"] += entry["slow_calls"]
+            total["histogram"] = [a + b for a, b in zip(total["histogram"], entry["histogram"])]
+            if entry["explain"] and (not total["explain"] or total["explain"]["state"] != "done"):
+                total["explain"] = entry["explain"]
+
+    shapes = []
+    for shape, entry in sorted(merged.items(), key=lambda item: item[1]["total_ms"], reverse=True)[:limit]:
+        shapes.append({
+            "shape": shape,
+            "calls": entry["calls"],
+            "total_ms": round(entry["total_ms"], 1),
+            "avg_ms": round(entry["total_ms"] / entry["calls"], 1),
+            "max_ms": round(entry["max_ms"], 1),
+            "p50_ms": _histogram_percentile(entry["histogram"], 50),
+            "p95_ms": _histogram_percentile(entry["histogram"], 95),
+            "slow_calls": entry["slow_calls"],
+            "explain": entry["explain"],
+        })
+    return {"workers": len(workers), "threshold_ms": THRESHOLD_MS, "shape_count": len(merged), "shapes": shapes}
+
+def print_report(profile):
+    print(f"{profile['shape_count']} query shapes, EXPLAIN above {profile['threshold_ms']:.0f}ms")
+    for entry in profile["shapes"]:
+        p95 = f"≤{entry['p95_ms']}ms" if entry["p95_ms"] is not None else f">{LATENCY_BUCKETS_MS[-1]}ms"
+        print(f"\n{entry['total_ms']:9.1f}ms total  {entry['calls']} calls  avg {entry['avg_ms']}ms  "
+              f"p95 {p95}  max {entry['max_ms']}ms")
+        print(f"  {entry['shape']}")
+        explain = entry["explain"]
+        if explain and explain.get("rows"):
+            for row in explain["rows"]:
+                print(f"    {row.get('table')}: type={row.get('type')} key={row.get('key')} "
+                      f"rows={row.get('rows')} {row.get('Extra') or ''}")
+        elif explain and explain.get("error"):
+            print(f"    EXPLAIN failed: {explain['error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the RadMac web UI's main read queries against DB_HOST.")
+    parser.add_argument("--threshold-ms", type=float, default=0,
+                        help="EXPLAIN every query shape slower than this (default: all of them)")
+    args = parser.parse_args()
+
+    global THRESHOLD_MS, EXPLAIN_IN_BACKGROUND
+    THRESHOLD_MS = args.threshold_ms
+    EXPLAIN_IN_BACKGROUND = False
+    # A throwaway shared cache, so cached reads (groups, counts) really hit the database
+    shared_cache.CACHE_PATH = os.path.join(tempfile.mkdtemp(prefix="radmac_profile_"), "cache.sqlite3")
+    add_query_listener(_record_query)
+
+    import db_interface
+    for func in (db_interface.get_all_users, db_interface.get_all_groups, db_interface.get_summary_counts,
+                 db_interface.get_latest_auth_logs, db_interface.get_database_stats, db_interface.get_table_stats):
+        started = time.perf_counter()
+        func()
+        print(f"[PROFILE] {func.__name__}: {(time.perf_counter() - started) * 1000:.1f}ms", file=sys.stderr)
+
+    print_report(get_query_profile())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+"""
+Per-request latency and database query accounting.
+
+init_request_timing(app) times every request and, through a db_connection
+query listener, counts the statements it runs and the time spent in them.
+Each response gets a Server-Timing header (shown per request in the browser's
+network panel). Durations are kept per endpoint over the last
+REQUEST_TIMING_WINDOW requests for the percentiles on /metrics, and requests
+slower than SLOW_REQUEST_MS are logged with their queries.
+
+Times are measured up to the response object, so streamed bodies (exports,
+SSE) only count the time until streaming starts.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from flask import g, has_app_context, request
+
+from db_connection import add_query_listener
+
+WINDOW = int(os.getenv('REQUEST_TIMING_WINDOW', 500))
+SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 1000))
+# Queries listed in a slow request log entry, and characters shown per query
+SLOW_LOG_MAX_QUERIES = 50
+SLOW_LOG_QUERY_CHARS = 200
+PERCENTILES = (50, 90, 95, 99)
+
+_endpoints = {}  # "METHOD endpoint" -> counters and a window of (total_ms, queries, db_ms)
+_lock = threading.Lock()
+
+def _record_query(statement, params, duration):
+    # Only requests started by _start_timer collect queries (not jobs or pollers)
+    if has_app_context():
+        queries = g.get("_timing_queries")
+        if queries is not None:
+            queries.append((statement, duration))
+
+def _start_timer():
+    g._timing_started = time.perf_counter()
+    g._timing_queries = []
+
+def _finish_timer(response):
+    started = g.pop("_timing_started", None)
+    queries = g.pop("_timing_queries", None)
+    if started is None:
+        return response
+    total_ms = (time.perf_counter() - started) * 1000
+    db_ms = sum(duration for _, duration in queries) * 1000
+
+    response.headers.add("Server-Timing", f'db;dur={db_ms:.1f};desc="{len(queries)} queries"')
+    response.headers.add("Server-Timing", f"app;dur={total_ms:.1f}")
+
+    key = f"{request.method} {request.endpoint or '<unmatched>'}"
+    with _lock:
+        stats = _endpoints.get(key)
+        if stats is None:
+            stats = _endpoints[key] = {"count": 0, "errors": 0, "max_ms": 0.0, "window": deque(maxlen=WINDOW)}
+        stats["count"] += 1
+        if response.status_code >= 500:
+            stats["errors"] += 1
+        stats["max_ms"] = max(stats["max_ms"], total_ms)
+        stats["window"].append((total_ms, len(queries), db_ms))
+
+    if total_ms >= SLOW_REQUEST_MS:
+        _log_slow_request(total_ms, db_ms, queries, response.status_code)
+    return response
+
+def _log_slow_request(total_ms, db_ms, queries, status_code):
+    print(f"🐢 Slow request: {request.method} {request.full_path.rstrip('?')} → {status_code} "
+          f"in {total_ms:.0f}ms, {len(queries)} queries ({db_ms:.0f}ms in the database)")
+    for statement, duration in queries[:SLOW_LOG_MAX_QUERIES]:
+        text = " ".join(str(statement).split())
+        if len(text) > SLOW_LOG_QUERY_CHARS:
+            text = text[:SLOW_LOG_QUERY_CHARS] + "…"
+        print(f"    {duration * 1000:8.1f}ms  {text}")
+    if len(queries) > SLOW_LOG_MAX_QUERIES:
+        print(f"    … {len(queries) - SLOW_LOG_MAX_QUERIES} more queries")
+
+def _percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return round(sorted_values[index], 1)
+
+def init_request_timing(app):
+    """Time every request of app; register before other before_request handlers so they are included."""
+    app.before_request(_start_timer)
+    app.after_request(_finish_timer)
+    add_query_listener(_record_query)
+
+def get_request_stats():
+    """Return per-endpoint latency percentiles and query counts of this worker, slowest p95 first."""
+    with _lock:
+        snapshot = {key: (stats["count"], stats["errors"], stats["max_ms"], list(stats["window"]))
+                    for key, stats in _endpoints.items()}
+
+    result = {}
+    for key, (count, errors, max_ms, window) in snapshot.items():
+        durations = sorted(total for total, _, _ in window)
+        entry = {"count": count, "errors": errors, "max_ms": round(max_ms, 1), "window": len(window)}
+        for pct in PERCENTILES:
+            entry[f"p{pct}_ms"] = _percentile(durations, pct)
+        entry["avg_queries"] = round(sum(queries for _, queries, _ in window) / len(window), 1)
+        entry["avg_db_ms"] = round(sum(db_ms for _, _, db_ms in window) / len(window), 1)
+        result[key] = entry
+    return dict(sorted(result.items(), key=lambda item: item[1]["p95_ms"], reverse=True))
@@ -0,0 +1,253 @@
+"""
+Host-local cache shared by all gunicorn workers, stored in a SQLite file.
+
+Values are pickled and expire after a per-key TTL. get_or_compute() coalesces
+concurrent misses: within a process through a per-key thread lock, and across
+workers through a lock row in the same SQLite file, so one request computes
+the value while identical requests wait for it.
+
+Read-mostly data (groups, web UI accounts, vendor prefixes) is cached under
+version-stamped keys: writers call bump_version(namespace) after committing,
+which makes every worker's next read miss and reload, without a TTL wait.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+CACHE_PATH = os.getenv('SHARED_CACHE_PATH', '/tmp/radmac_shared_cache.sqlite3')
+PURGE_INTERVAL = 60
+# How long a worker trusts a version stamp it read before checking SQLite again
+VERSION_CHECK_INTERVAL = 1.0
+
+_local = threading.local()
+_key_locks = {}  # key -> [lock, number of threads holding or waiting for it]
+_key_locks_guard = threading.Lock()
+_last_purge = {"at": 0.0}
+_versions = {}  # namespace -> (version, checked_at)
+_versions_lock = threading.Lock()
+
+def _get_db():
+    """Return this thread's SQLite connection, creating the cache schema on first use."""
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = sqlite3.connect(CACHE_PATH, timeout=5, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS cache_locks (
+                key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            )
+        """)
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS versions (
+                namespace TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        """)
+        _local.db = db
+    return db
+
+@contextmanager
+def _key_lock(key):
+    """Hold the per-key lock; its entry is dropped once no thread holds or waits for it."""
+    with _key_locks_guard:
+        entry = _key_locks.get(key)
+        if entry is None:
+            entry = _key_locks[key] = [threading.Lock(), 0]
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _key_locks[key]
+
+def get(key, default=None):
+    """Return the cached value for key, or default if it is missing or expired."""
+    try:
+        row = _get_db().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache read failed for {key}: {e}")
+        return default
+    return pickle.loads(row[0]) if row else default
+
+def put(key, value, ttl):
+    """Store value under key for ttl seconds."""
+    now = time.time()
+    try:
+        db = _get_db()
+        db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), now + ttl)
+        )
+        if now - _last_purge["at"] > PURGE_INTERVAL:
+            _last_purge["at"] = now
+            db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            db.execute("DELETE FROM cache_locks WHERE expires_at <= ?", (now,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache write failed for {key}: {e}")
+
+def get_many(keys):
+    """Return {key: value} for the keys that are cached and not expired."""
+    keys = list(keys)
+    values = {}
+    try:
+        db = _get_db()
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ", ".join(["?"] * len(chunk))
+            rows = db.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND expires_at > ?",
+                (*chunk, time.time())
+            ).fetchall()
+            values.update((key, pickle.loads(value)) for key, value in rows)
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache read failed for {len(keys)} keys: {e}")
+    return values
+
+def get_prefix(prefix):
+    """Return {key: value} for every cached, unexpired key starting with prefix."""
+    try:
+        rows = _get_db().execute(
+            "SELECT key, value FROM cache WHERE key >= ? AND key < ? AND expires_at > ?",
+            (prefix, prefix + "\U0010ffff", time.time())
+        ).fetchall()
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache read failed for {prefix}*: {e}")
+        return {}
+    return {key: pickle.loads(value) for key, value in rows}
+
+def set_many(items, ttl):
+    """Store every key/value pair of the items mapping for ttl seconds in one transaction."""
+    if not items:
+        return
+    expires_at = time.time() + ttl
+    try:
+        db = _get_db()
+        with db:
+            db.execute("BEGIN")
+            db.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires_at)
+                 for key, value in items.items()]
+            )
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache write failed for {len(items)} keys: {e}")
+
+def delete(key):
+    """Remove key from the cache."""
+    try:
+        _get_db().execute("DELETE FROM cache WHERE key = ?", (key,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache delete failed for {key}: {e}")
+
+def _acquire_compute_lock(key, lock_ttl):
+    """Try to become the one worker computing key. Returns True on success."""
+    now = time.time()
+    try:
+        db = _get_db()
+        db.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at <= ?", (key, now))
+        cursor = db.execute(
+            "INSERT OR IGNORE INTO cache_locks (key, expires_at) VALUES (?, ?)", (key, now + lock_ttl)
+        )
+        return cursor.rowcount == 1
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache lock failed for {key}: {e}")
+        return True
+
+def _release_compute_lock(key):
+    try:
+        _get_db().execute("DELETE FROM cache_locks WHERE key = ?", (key,))
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache unlock failed for {key}: {e}")
+
+def get_or_compute(key, ttl, compute, wait_timeout=10.0, poll_interval=0.05):
+    """Return the cached value for key, calling compute() at most once across workers on a miss.
+
+    If another worker holds the compute lock, wait up to wait_timeout seconds
+    for its result before computing locally.
+    """
+    missing = object()
+    value = get(key, missing)
+    if value is not missing:
+        return value
+
+    with _key_lock(key):
+        value = get(key, missing)
+        if value is not missing:
+            return value
+
+        if not _acquire_compute_lock(key, wait_timeout):
+            deadline = time.monotonic() + wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(poll_interval)
+                value = get(key, missing)
+                if value is not missing:
+                    return value
+            print(f"⚠️ Timed out waiting for shared cache key {key}, computing locally")
+            value = compute()
+            put(key, value, ttl)
+            return value
+
+        try:
+            value = compute()
+            put(key, value, ttl)
+            return value
+        finally:
+            _release_compute_lock(key)
+
+def get_version(namespace):
+    """Return namespace's version stamp (0 before its first bump), rereading it at most every VERSION_CHECK_INTERVAL."""
+    now = time.monotonic()
+    with _versions_lock:
+        cached = _versions.get(namespace)
+        if cached and now - cached[1] < VERSION_CHECK_INTERVAL:
+            return cached[0]
+    try:
+        row = _get_db().execute("SELECT version FROM versions WHERE namespace = ?", (namespace,)).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache version read failed for {namespace}: {e}")
+        return cached[0] if cached else 0
+    version = row[0] if row else 0
+    with _versions_lock:
+        _versions[namespace] = (version, now)
+    return version
+
+def bump_version(namespace):
+    """Advance namespace's version stamp after a write, so every worker stops using values cached for it."""
+    try:
+        db = _get_db()
+        db.execute("INSERT OR IGNORE INTO versions (namespace, version) VALUES (?, 0)", (namespace,))
+        db.execute("UPDATE versions SET version = version + 1 WHERE namespace = ?", (namespace,))
+        version = db.execute("SELECT version FROM versions WHERE namespace = ?", (namespace,)).fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"⚠️ Shared cache version bump failed for {namespace}: {e}")
+        with _versions_lock:
+            _versions.pop(namespace, None)
+        return
+    # This worker sees its own write immediately
+    with _versions_lock:
+        _versions[namespace] = (version, time.monotonic())
+
+def versioned_key(namespace, key):
+    """Return the cache key for key under namespace's current version stamp."""
+    return f"{namespace}@{get_version(namespace)}:{key}"
+
+def get_versioned(namespace, key, ttl, compute):
+    """Like get_or_compute(), for a value derived from namespace's data; bump_version(namespace) invalidates it."""
+    return get_or_compute(versioned_key(namespace, key), ttl, compute)
@@ -0,0 +1,174 @@
+"""
+Helpers for streaming large HTTP responses and uploads with constant memory.
+"""
+import re
+import zlib
+
+def gzip_stream(chunks, level=6, min_flush=64 * 1024):
+    """Gzip-compress an iterable of str/bytes chunks, yielding compressed blocks of at least min_flush bytes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    pending = []
+    pending_size = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            pending.append(data)
+            pending_size += len(data)
+        if pending_size >= min_flush:
+            yield b"".join(pending)
+            pending = []
+            pending_size = 0
+    pending.append(compressor.flush())
+    yield b"".join(pending)
+
+class SQLStatementSplitter:
+    """Split SQL text fed in arbitrary chunks into statements, like the mysql client does.
+
+    Delimiters inside quoted strings, quoted identifiers and comments are
+    ignored, DELIMITER commands are honoured, and statements holding nothing
+    but comments are dropped. MySQL conditional comments (/*! ... */) are kept.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0            # scan position in buffer
+        self.start = None       # index of the current statement's first non-comment character
+        self.quote = None       # ', " or ` while inside a quoted string/identifier
+        self.comment = None     # "\n" or "*/" (the terminator) while inside a comment
+        self.set_delimiter(";")
+
+    def set_delimiter(self, delimiter):
+        self.delimiter = delimiter
+        self._specials = re.compile("[-'\"`#/" + re.escape(delimiter[0]) + "]")
+
+    def _mark_content(self, index):
+        if self.start is None:
+            self.start = index
+
+    def feed(self, text, final=False):
+        """Add text and return the list of statements it completed. Pass final=True for the last chunk."""
+        buf = self.buffer + text
+        n = len(buf)
+        i = self.pos
+        region = 0  # start of the not yet emitted part of buf
+        statements = []
+
+        while i < n:
+            if self.quote:
+                if self.quote == "`":
+                    j = buf.find("`", i)
+                else:
+                    match = _QUOTE_SPECIALS[self.quote].search(buf, i)
+                    j = match.start() if match else -1
+                if j < 0:
+                    i = n
+                    break
+                if buf[j] == "\\":
+                    if j + 1 >= n and not final:
+                        i = j
+                        break
+                    i = j + 2
+                    continue
+                # A doubled quote ('') closes and immediately reopens the string
+                self.quote = None
+                i = j + 1
+                continue
+
+            if self.comment:
+                j = buf.find(self.comment, i)
+                if j < 0:
+                    i = max(i, n - len(self.comment) + 1)
+                    break
+                i = j + len(self.comment)
+                self.comment = None
+                continue
+
+            if self.start is None:
+                while i < n and buf[i].isspace():
+                    i += 1
+                if i >= n:
+                    break
+                if buf[i] in "Dd":
+                    newline = buf.find("\n", i)
+                    if newline < 0 and not final:
+                        break
+                    line_end = newline if newline >= 0 else n
+                    match = _DELIMITER_RE.match(buf, i, line_end)
+                    if match:
+                        self.set_delimiter(match.group(1))
+                        i = region = line_end + 1 if newline >= 0 else n
+                        continue
+
+            match = self._specials.search(buf, i)
+            j = match.start() if match else n
+            if self.start is None and buf[i:j].strip():
+                self._mark_content(i + len(buf[i:j]) - len(buf[i:j].lstrip()))
+            if not match:
+                i = n
+                break
+
+            c = buf[j]
+            if c in "'\"`":
+                self._mark_content(j)
+                # Skip a complete string in one regex match; fall back to quote state at a chunk boundary
+                string = _STRINGS[c].match(buf, j)
+                if string:
+                    i = string.end()
+                else:
+                    self.quote = c
+                    i = j + 1
+            elif c == "#":
+                self.comment = "\n"
+                i = j + 1
+            elif c in "-/" and j + 2 >= n and not final:
+                i = j
+                break
+            elif c == "-" and buf.startswith("--", j) and (j + 2 >= n or buf[j + 2].isspace()):
+                self.comment = "\n"
+                i = j + 2
+            elif c == "/" and buf.startswith("/*", j) and not buf.startswith("/*!", j):
+                self.comment = "*/"
+                i = j + 2
+            elif buf.startswith(self.delimiter, j):
+                if self.start is not None:
+                    statements.append(buf[self.start:j].strip())
+                self.start = None
+                i = region = j + len(self.delimiter)
+            elif j + len(self.delimiter) > n and self.delimiter.startswith(buf[j:]) and not final:
+                i = j
+                break
+            else:
+                self._mark_content(j)
+                i = j + 1
+
+        if final:
+            if self.quote:
+                raise ValueError(f"Unterminated {self.quote} quote at end of SQL input")
+            if self.start is not None:
+                statements.append(buf[self.start:].strip())
+            self.start = None
+            region = i = n
+
+        # Keep only the unfinished statement, rebasing indices onto the trimmed buffer
+        self.buffer = buf[region:]
+        self.pos = i - region
+        if self.start is not None:
+            self.start -= region
+        return statements
+
+_QUOTE_SPECIALS = {"'": re.compile(r"[\\']"), '"': re.compile(r'[\\"]')}
+_STRINGS = {
+    "'": re.compile(r"'[^'\\]*(?:\\.[^'\\]*)*'", re.DOTALL),
+    '"': re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL),
+    "`": re.compile(r"`[^`]*`"),
+}
+_DELIMITER_RE = re.compile(r"(?i)DELIMITER[ \t]+(\S+)[ \t]*\r?$")
+
+def iter_sql_statements(chunks):
+    """Yield the SQL statements in an iterable of text chunks."""
+    splitter = SQLStatementSplitter()
+    for chunk in chunks:
+        yield from splitter.feed(chunk)
+    yield from splitter.feed("", final=True)
@@ -0,0 +1,79 @@
+"""
+Thread-safe in-process LRU cache with per-entry TTLs and stale-while-revalidate.
+
+An entry is fresh until its TTL runs out, then stale for stale_ttl more
+seconds: stale values are still served, and the caller is expected to refresh
+them in the background (begin_refresh()/end_refresh() make sure only one
+refresh per key runs at a time). None values are negative entries and use
+negative_ttl.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+class TTLCache:
+
+    def __init__(self, max_size, ttl, negative_ttl=None, stale_ttl=0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self.hits = self.stale_hits = self.misses = 0
+
+    def get(self, key):
+        """Return (state, value) where state is FRESH, STALE or MISS."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry[1] + self.stale_ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISS, None
+            self._entries.move_to_end(key)
+            if now < entry[1]:
+                self.hits += 1
+                return FRESH, entry[0]
+            self.stale_hits += 1
+            return STALE, entry[0]
+
+    def set(self, key, value, ttl=None):
+        """Store value (None for a negative entry), evicting the least recently used entries when full."""
+        if ttl is None:
+            ttl = self.negative_ttl if value is None else self.ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Drop one entry, or every entry when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def begin_refresh(self, keys):
+        """Mark keys as being refreshed and return those no other caller is already refreshing."""
+        with self._lock:
+            claimed = [key for key in keys if key not in self._refreshing]
+            self._refreshing.update(claimed)
+            return claimed
+
+    def end_refresh(self, keys):
+        with self._lock:
+            self._refreshing.difference_update(keys)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits,
+                    "stale_hits": self.stale_hits, "misses": self.misses}
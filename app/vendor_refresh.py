@@ -0,0 +1,128 @@
+"""
+Refresh of vendor names for user MAC prefixes missing from mac_vendors.
+
+Prefixes covered by the imported IEEE registry are skipped. The rest are
+looked up by a small thread pool sharing the worker's keep-alive API session
+and token bucket, so the refresh runs at exactly OUI_API_LIMIT_PER_SEC. API
+calls are counted per UTC day in oui_api_usage, keeping OUI_API_DAILY_LIMIT
+across restarts. Results are stored in batched upserts. The web UI runs it
+as a background job (see jobs.py), so it does not depend on the request.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import oui_api
+from db_connection import get_connection
+from db_interface import (get_unknown_vendor_prefixes, get_oui_api_usage, record_oui_api_usage,
+                          store_vendor_results, lookup_oui)
+
+REFRESH_LOCK_NAME = "radmac_vendor_refresh"
+MAX_RATE_LIMIT_RETRIES = 5
+CANCELLED = "cancelled"
+
+def run_vendor_refresh(config, batch_size=100, progress=None, should_stop=None):
+    """Look up every unknown user prefix through the API and store the results. Returns the final status.
+
+    config is a mapping with the OUI_API_* settings (current_app.config or the
+    Config class values). progress is called with the status dict after each
+    batch; once should_stop() returns True no further API calls are made.
+    Only one refresh runs at a time across workers.
+    """
+    url_template = config.get("OUI_API_URL", "https://api.maclookup.app/v2/macs/{}")
+    api_key = config.get("OUI_API_KEY", "")
+    rate = int(config.get("OUI_API_LIMIT_PER_SEC", 2))
+    daily_limit = int(config.get("OUI_API_DAILY_LIMIT", 10000))
+    concurrency = max(1, int(config.get("OUI_API_CONCURRENCY", 4)))
+
+    lock_conn = get_connection(request_scoped=False)
+    lock_cursor = lock_conn.cursor()
+    lock_cursor.execute("SELECT GET_LOCK(%s, 0)", (REFRESH_LOCK_NAME,))
+    if lock_cursor.fetchone()[0] != 1:
+        lock_cursor.close()
+        lock_conn.close()
+        print("→ A vendor refresh is already running in another worker.")
+        return {"state": "already_running"}
+
+    status = {
+        "state": "running", "started_at": time.time(), "finished_at": None,
+        "total": 0, "processed": 0, "found": 0, "not_found": 0, "errors": 0,
+        "api_calls": 0, "quota_remaining": None,
+    }
+    try:
+        prefixes = [prefix for prefix in get_unknown_vendor_prefixes() if not lookup_oui(prefix)]
+        remaining = max(0, daily_limit - get_oui_api_usage())
+        status["quota_remaining"] = remaining
+        if len(prefixes) > remaining:
+            print(f"🛑 {len(prefixes)} unknown prefixes but only {remaining} API calls left today ({daily_limit}/day).")
+            prefixes = prefixes[:remaining]
+        status["total"] = len(prefixes)
+        if progress:
+            progress(status)
+        print(f"→ Refreshing {len(prefixes)} unknown prefixes at {rate}/s with {concurrency} connections.")
+
+        bucket = oui_api.get_rate_limiter(rate)
+        oui_api.get_session(pool_size=concurrency)
+        counter_lock = threading.Lock()
+        calls = {"total": 0, "recorded": 0}
+
+        def lookup(prefix):
+            for _ in range(MAX_RATE_LIMIT_RETRIES):
+                if should_stop and should_stop():
+                    return prefix, None, CANCELLED
+                bucket.acquire()
+                with counter_lock:
+                    calls["total"] += 1
+                try:
+                    return prefix, oui_api.fetch_vendor(prefix, url_template, api_key), None
+                except oui_api.RateLimited as e:
+                    print(f"  ⏳ Rate limited by the API, pausing {e.retry_after}s")
+                    bucket.pause(e.retry_after)
+                except (oui_api.ApiError, requests.exceptions.RequestException) as e:
+                    return prefix, None, str(e)
+            return prefix, None, "rate limited"
+
+        batch = []
+
+        def flush():
+            store_vendor_results(batch)
+            batch.clear()
+            with counter_lock:
+                unrecorded = calls["total"] - calls["recorded"]
+                calls["recorded"] = calls["total"]
+            record_oui_api_usage(unrecorded)
+            status["api_calls"] = calls["total"]
+            status["quota_remaining"] = remaining - calls["total"]
+            if progress:
+                progress(status)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="vendor-lookup") as pool:
+            for prefix, vendor, error in pool.map(lookup, prefixes):
+                if error == CANCELLED:
+                    continue
+                status["processed"] += 1
+                if error:
+                    print(f"  ❌ {prefix}: {error}")
+                    status["errors"] += 1
+                    continue
+                status["found" if vendor else "not_found"] += 1
+                batch.append((prefix, vendor))
+                if len(batch) >= batch_size:
+                    flush()
+        flush()
+
+        status["state"] = "cancelled" if should_stop and should_stop() else "done"
+        print(f"→ Vendor refresh finished: {status['found']} found, {status['not_found']} not found, "
+              f"{status['errors']} errors, {status['api_calls']} API calls.")
+        return status
+    except Exception as e:
+        status.update(state="failed", error=str(e))
+        raise
+    finally:
+        status["finished_at"] = time.time()
+        lock_cursor.execute("SELECT RELEASE_LOCK(%s)", (REFRESH_LOCK_NAME,))
+        lock_cursor.fetchone()
+        lock_cursor.close()
+        lock_conn.close()
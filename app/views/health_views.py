@@ -2,11 +2,17 @@ from flask import Blueprint, jsonify
 import mysql.connector
 import os
 import socket
-from db_connection import get_connection
+import time
+from db_connection import get_connection, get_replica_status, get_pool_stats, get_breaker_state
+from db_interface import get_vendor_cache_stats
+from request_timing import get_request_stats
 from datetime import datetime
 
 health = Blueprint('health', __name__)
 
+# Seconds after a pool exhaustion during which /health reports the pool as degraded
+POOL_EXHAUSTION_WINDOW = 60
+
 @health.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint that returns JSON status of app, database, and radius server."""
@@ -57,6 +63,34 @@ def health_check():
             "message": error_msg
         }
     
+    # Read replica (optional): reads fall back to the primary, so this never fails the check
+    replica = get_replica_status()
+    if replica["configured"]:
+        status["services"]["database_replica"] = {
+            "status": "healthy" if replica["healthy"] else "degraded",
+            "message": (f"Read replica lag {replica['lag_seconds']}s" if replica["healthy"]
+                        else "Read replica unavailable or lagging, reads use the primary"),
+            "lag_seconds": replica["lag_seconds"]
+        }
+
+    # Circuit breakers of this worker; the watchdog alerts when one opens
+    status["circuit_breakers"] = {"database": get_breaker_state()}
+
+    # Connection pool pressure: waiting callers or a recent exhaustion degrade, but never fail, the check
+    pool = get_pool_stats()["primary"]
+    if pool:
+        recently_exhausted = pool["last_exhausted_at"] and time.time() - pool["last_exhausted_at"] < POOL_EXHAUSTION_WINDOW
+        status["services"]["database_pool"] = {
+            "status": "degraded" if pool["waiting"] or recently_exhausted else "healthy",
+            "message": (f"{pool['checked_out']}/{pool['pool_size']} connections in use, "
+                        f"{pool['overflow_in_use']} overflow, {pool['waiting']} waiting"),
+            "checked_out": pool["checked_out"],
+            "pool_size": pool["pool_size"],
+            "waiting": pool["waiting"],
+            "exhausted": pool["exhausted"],
+            "timeouts": pool["timeouts"],
+        }
+
     # Check RADIUS Server Health (basic connectivity test)
     try:
         # Try to connect to the RADIUS server port
@@ -100,4 +134,15 @@ def health_check():
     # Return appropriate HTTP status code
     http_status = 200 if overall_healthy else 503
     
-    return jsonify(status), http_status
\ No newline at end of file
+    return jsonify(status), http_status
+
+@health.route('/metrics', methods=['GET'])
+def metrics():
+    """Internal counters of this worker: request latency per endpoint, database pools and the vendor cache."""
+    return jsonify({
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "pid": os.getpid(),
+        "requests": get_request_stats(),
+        "database_pool": get_pool_stats(),
+        "vendor_cache": get_vendor_cache_stats(),
+    })
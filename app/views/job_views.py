@@ -0,0 +1,25 @@
+from flask import Blueprint, jsonify, request
+from jobs import get_job, list_jobs, cancel_job
+
+jobs = Blueprint('jobs', __name__)
+
+@jobs.route('/', methods=['GET'])
+def job_list():
+    """Return the most recent background jobs with their status and progress."""
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    return jsonify(list_jobs(limit))
+
+@jobs.route('/<int:job_id>', methods=['GET'])
+def job_status(job_id):
+    """Return one background job's status, progress and result."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@jobs.route('/<int:job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    """Cancel a queued job or ask a running one to stop at its next checkpoint."""
+    if not cancel_job(job_id):
+        return jsonify({"error": "Job is not queued or running"}), 409
+    return jsonify(get_job(job_id))
@@ -1,7 +1,16 @@
-from flask import Blueprint, render_template, request, send_file
+from flask import Blueprint, render_template, request, flash, redirect, url_for, Response, stream_with_context, jsonify
 import mysql.connector
-import os
-from db_interface import get_database_stats, clear_auth_logs, backup_database, restore_database, get_table_stats # Import the functions from db_interface.py
+import csv
+import io
+import json
+import re
+import time
+from datetime import datetime
+from streaming import gzip_stream
+import shared_cache
+import query_profiler
+from jobs import enqueue, job_file_path, is_job_active
+from db_interface import get_database_stats, get_table_stats, iter_auth_logs, iter_database_backup, estimate_backup_size # Import the functions from db_interface.py
 
 
 maintenance = Blueprint('maintenance', __name__, url_prefix='/maintenance')
@@ -11,28 +20,102 @@ def maintenance_page():
     """Renders the maintenance page with table and DB stats."""
     table_stats = get_table_stats()
     db_stats = get_database_stats()
-    return render_template('maintenance.html', table_stats=table_stats, db_stats=db_stats)
+    query_profile = query_profiler.get_query_profile() if query_profiler.ENABLED else None
+    return render_template('maintenance.html', table_stats=table_stats, db_stats=db_stats,
+                           exact_count_running=is_job_active('count_table_rows'), query_profile=query_profile)
+
+@maintenance.route('/query_profile/reset', methods=['POST'])
+def reset_query_profile_route():
+    """Route to clear the query profiler's counters in every worker."""
+    query_profiler.reset_query_profile()
+    flash("✅ Query profile cleared.", "success")
+    return redirect(url_for('maintenance.maintenance_page'))
+
+@maintenance.route('/count_rows', methods=['POST'])
+def count_rows_route():
+    """Route to start an exact row count of every table in a background job."""
+    job_id = enqueue('count_table_rows', unique=True)
+    flash(f"⏳ Counting rows in the background (job #{job_id}). Refresh this page once it is done.", "success")
+    return redirect(url_for('maintenance.maintenance_page'))
 
 @maintenance.route('/clear_auth_logs', methods=['POST'])
 def clear_auth_logs_route():
-    """Route to clear authentication logs."""
-    return clear_auth_logs()
+    """Route to clear authentication logs in a background job."""
+    job_id = enqueue('clear_auth_logs', unique=True)
+    flash(f"⏳ Clearing authentication logs in the background (job #{job_id}).", "success")
+    return redirect(url_for('maintenance.maintenance_page'))
+
+BACKUP_PROGRESS_TTL = 3600
+
+def split_table_list(value):
+    return [t for t in re.split(r'[\s,]+', value or '') if t]
 
 @maintenance.route('/backup_database', methods=['GET'])
 def backup_database_route():
-    """Route to backup the database."""
-    try:
-        backup_file = backup_database()
-        return send_file(backup_file, as_attachment=True, download_name='database_backup.sql')
-    except Exception as e:
-        return str(e), 500
-    finally:
-        if os.path.exists('backup.sql'):
-            os.remove('backup.sql')
+    """Route to backup the database as a gzip-compressed SQL dump streamed from mysqldump.
+
+    Query args: tables / exclude (comma-separated), auth_logs_days to dump only
+    recent auth_logs, and progress_id to publish progress for /backup_progress.
+    """
+    tables = split_table_list(request.args.get('tables'))
+    exclude = split_table_list(request.args.get('exclude'))
+    auth_logs_days = request.args.get('auth_logs_days', type=int)
+    progress_id = re.sub(r'[^A-Za-z0-9_-]', '', request.args.get('progress_id', ''))[:64]
+
+    if not all(re.match(r'^[A-Za-z0-9_]+$', t) for t in tables + exclude):
+        return "Invalid table name", 400
+
+    state = {
+        "status": "running",
+        "bytes": 0,
+        "table": None,
+        "estimated_bytes": estimate_backup_size(tables, exclude),
+        "updated_at": 0.0
+    }
+
+    def publish(force=False):
+        now = time.monotonic()
+        if progress_id and (force or now - state["updated_at"] >= 0.5):
+            state["updated_at"] = now
+            shared_cache.put(f"backup_progress:{progress_id}", dict(state), BACKUP_PROGRESS_TTL)
+
+    def progress(size, table):
+        state["bytes"] += size
+        if table:
+            state["table"] = table
+        publish()
+
+    def generate():
+        publish(force=True)
+        try:
+            yield from iter_database_backup(tables, exclude, auth_logs_days, progress)
+            state["status"] = "done"
+        except Exception as e:
+            state["status"] = "failed"
+            state["error"] = str(e)
+            print(f"❌ Streaming backup failed: {e}")
+            raise
+        finally:
+            if state["status"] == "running":
+                state["status"] = "cancelled"
+            publish(force=True)
+
+    filename = f"database_backup_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.sql.gz"
+    return Response(stream_with_context(gzip_stream(generate())), mimetype='application/gzip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
+@maintenance.route('/backup_progress/<progress_id>', methods=['GET'])
+def backup_progress_route(progress_id):
+    """Return the progress of a streaming backup started with this progress_id."""
+    state = shared_cache.get(f"backup_progress:{progress_id}")
+    if state is None:
+        return jsonify({"status": "unknown"}), 404
+    return jsonify(state)
 
 @maintenance.route('/restore_database', methods=['POST'])
 def restore_database_route():
-    """Route to restore the database."""
+    """Route to restore the database from an uploaded .sql or .sql.gz file in a background job."""
     if 'file' not in request.files:
         return "No file provided", 400
 
@@ -40,12 +123,57 @@ def restore_database_route():
     if sql_file.filename == '':
         return "No file selected", 400
 
-    if not sql_file.filename.endswith('.sql'):
-        return "Invalid file type.  Only .sql files are allowed.", 400
+    if not sql_file.filename.endswith(('.sql', '.sql.gz')):
+        return "Invalid file type.  Only .sql and .sql.gz files are allowed.", 400
+
+    # The job may run in another worker thread or process, so hand it the upload as a file;
+    # local=True keeps it on this host, where the file is
+    path = job_file_path('.sql.gz' if sql_file.filename.endswith('.gz') else '.sql')
+    sql_file.save(path)
+    job_id = enqueue('restore_database', {'path': path, 'filename': sql_file.filename}, local=True)
+    flash(f"⏳ Restoring {sql_file.filename} in the background (job #{job_id}).", "success")
+    return redirect(url_for('maintenance.maintenance_page'))
+
+AUTH_LOG_EXPORT_FIELDS = ["id", "timestamp", "mac_address", "reply", "result"]
+
+def auth_logs_as_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(AUTH_LOG_EXPORT_FIELDS)
+    for row in rows:
+        writer.writerow([row[field] for field in AUTH_LOG_EXPORT_FIELDS])
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
 
+def auth_logs_as_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + "\n"
+
+@maintenance.route('/export_auth_logs', methods=['GET'])
+def export_auth_logs_route():
+    """Stream auth_logs for a time range as gzip-compressed CSV or NDJSON.
+
+    Query args: start/end (ISO datetimes, UTC), format (csv|ndjson) and
+    after_id to resume an interrupted export from the last id received.
+    """
     try:
-        sql_content = sql_file.read().decode('utf-8')
-        message = restore_database(sql_content)
-        return message
-    except Exception as e:
-        return str(e), 500
\ No newline at end of file
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else None
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else None
+        after_id = int(request.args.get('after_id') or 0)
+    except ValueError as e:
+        return f"Invalid export parameters: {e}", 400
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return "Invalid format. Use csv or ndjson.", 400
+
+    rows = iter_auth_logs(start=start, end=end, after_id=after_id)
+    body = auth_logs_as_csv(rows) if fmt == 'csv' else auth_logs_as_ndjson(rows)
+    filename = f"auth_logs_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{fmt}.gz"
+
+    return Response(stream_with_context(gzip_stream(body)), mimetype='application/gzip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
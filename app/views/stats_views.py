@@ -1,14 +1,34 @@
-from flask import Blueprint, render_template, request, current_app, redirect, url_for, jsonify
-from db_interface import get_latest_auth_logs, count_auth_logs, get_all_groups, get_vendor_info, get_user_by_mac, add_user, get_known_mac_vendors
+from flask import Blueprint, render_template, request, current_app, redirect, url_for, jsonify, Response, stream_with_context
+from db_interface import get_auth_logs_page, get_auth_logs_version, get_all_groups, get_mac_enrichment, add_user, get_cached_vendors, lookup_oui, VENDOR_NOT_FOUND
 from math import ceil
+import hashlib
+import json
+import queue
 import re
-import pytz
-import humanize
-from datetime import datetime, timezone, timedelta
-from time import sleep
+from datetime import timezone, timedelta
+import shared_cache
+from auth_log_stream import AuthLogBroadcaster
+from jobs import enqueue
+from db_connection import release_request_connections
 
 stats = Blueprint('stats', __name__)
 
+STATS_CARDS = (
+    ('accept', 'Access-Accept'),
+    ('reject', 'Access-Reject'),
+    ('fallback', 'Accept-Fallback'),
+)
+
+MAX_PER_PAGE = 100
+
+# How long a prefix queued for a vendor lookup is not queued again
+VENDOR_LOOKUP_PENDING_TTL = 300
+
+STATS_ARGS = ('time_range', 'per_page',
+              'page_accept', 'dir_accept', 'cursor_accept',
+              'page_reject', 'dir_reject', 'cursor_reject',
+              'page_fallback', 'dir_fallback', 'cursor_fallback')
+
 def get_time_filter_delta(time_range):
     return {
         "last_minute": timedelta(minutes=1),
@@ -21,42 +41,133 @@ def get_time_filter_delta(time_range):
         "last_30_days": timedelta(days=30),
     }.get(time_range)
 
-def get_pagination_data(current_page, total_pages, max_display=7):
-    if total_pages == 0:
-        return {
-            "pages": [],
-            "show_first": False,
-            "show_last": False,
-            "show_prev": False,
-            "show_next": False,
-            "prev_page": 1,
-            "next_page": 1,
-            "first_page": 1,
-            "last_page": 1
-        }
-
-    if total_pages <= max_display:
-        pages = list(range(1, total_pages + 1))
-    else:
-        half = max_display // 2
-        start = max(1, current_page - half)
-        end = min(total_pages, start + max_display - 1)
-        if end - start + 1 < max_display:
-            start = max(1, end - max_display + 1)
-        pages = list(range(start, end + 1))
+def get_cursor_pagination(log_page, current_page, per_page):
+    """Build template data for prev/next navigation over a keyset-paginated card."""
+    if log_page["prev_cursor"] is None:
+        current_page = 1
+
+    total = log_page["total"]
+    total_pages = max(ceil(total / per_page), current_page) if total else None
 
     return {
-        "pages": pages,
-        "show_first": 1 not in pages,
-        "show_last": total_pages not in pages,
-        "show_prev": current_page > 1,
-        "show_next": current_page < total_pages,
+        "current_page": current_page,
+        "total_pages": total_pages,
+        "approximate": log_page["total_is_estimate"],
+        "show_first": log_page["prev_cursor"] is not None,
+        "show_prev": log_page["prev_cursor"] is not None,
+        "show_next": log_page["next_cursor"] is not None,
+        "prev_cursor": log_page["prev_cursor"],
+        "next_cursor": log_page["next_cursor"],
         "prev_page": max(current_page - 1, 1),
-        "next_page": min(current_page + 1, total_pages),
-        "first_page": 1,
-        "last_page": total_pages
+        "next_page": current_page + 1
+    }
+
+def load_log_card(card, reply_type, per_page, time_range):
+    """Fetch one stats card using the cursor args for that card."""
+    cursor = request.args.get(f'cursor_{card}') or None
+    direction = request.args.get(f'dir_{card}', 'next')
+    current_page = max(request.args.get(f'page_{card}', 1, type=int), 1)
+    totals = current_app.config.get('STATS_PAGE_TOTALS', 'approx')
+
+    log_page = get_auth_logs_page(reply_type, per_page, time_range, cursor, direction,
+                                  total=totals if totals in ('approx', 'exact') else None)
+    pagination = get_cursor_pagination(log_page, current_page, per_page)
+    return log_page["entries"], pagination
+
+def to_iso(ts):
+    """Serialize a naive UTC DATETIME from auth_logs as an ISO 8601 string."""
+    if not ts:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.isoformat()
+
+def serialize_auth_log(entry, mac_info):
+    """Convert an auth_logs row plus its get_mac_enrichment() info into a JSON-ready dict."""
+    info = mac_info.get(entry['mac_address'].lower(), {})
+    user = info.get('user')
+    match = re.search(r'VLAN\s+(\d+)', entry.get('result') or '')
+    return {
+        "id": entry['id'],
+        "mac_address": entry['mac_address'],
+        "reply": entry.get('reply'),
+        "timestamp": to_iso(entry.get('timestamp')),
+        "result": entry.get('result'),
+        "vendor": info.get('vendor'),
+        "already_exists": user is not None,
+        "existing_vlan": user['vlan_id'] if user else None,
+        "description": user['description'] if user else None,
+        "vlan_id": match.group(1) if match else None,
+    }
+
+def queue_vendor_lookups(mac_info):
+    """Hand MACs get_mac_enrichment() could not resolve to a lookup_macs job, one MAC per prefix.
+
+    Prefixes stay marked as pending in the shared cache for
+    VENDOR_LOOKUP_PENDING_TTL seconds, so polls of the same page do not queue
+    them again; the job's results bump "vendor_rows" and so the stats ETag.
+    """
+    unresolved = {}
+    for mac, info in mac_info.items():
+        if info['vendor'] is None:
+            unresolved.setdefault(f"vendor_lookup_pending:{mac[:6]}", mac)
+    if not unresolved:
+        return
+    pending = shared_cache.get_many(unresolved)
+    todo = {key: mac for key, mac in unresolved.items() if key not in pending}
+    if todo:
+        shared_cache.set_many({key: True for key in todo}, VENDOR_LOOKUP_PENDING_TTL)
+        enqueue('lookup_macs', {'macs': sorted(todo.values())})
+
+def enrich_macs(mac_addresses):
+    """get_mac_enrichment() for a page of MACs, queueing vendor lookups for the unknown ones."""
+    mac_info = get_mac_enrichment(mac_addresses)
+    queue_vendor_lookups(mac_info)
+    return mac_info
+
+def serialize_auth_logs(entries):
+    """Enrich and serialize a batch of auth_logs rows with one users and one vendors query."""
+    mac_info = enrich_macs([e['mac_address'] for e in entries])
+    return [serialize_auth_log(entry, mac_info) for entry in entries]
+
+def build_stats_data(time_range, per_page):
+    """Build the JSON-serializable data for all three stats cards from the current request args."""
+    cards = {}
+    for card, reply_type in STATS_CARDS:
+        entries, pagination = load_log_card(card, reply_type, per_page, time_range)
+        cards[card] = {"entries": entries, "pagination": pagination}
+
+    # Resolve users and vendors for every MAC on the page in two queries
+    mac_info = enrich_macs([e['mac_address'] for c in cards.values() for e in c["entries"]])
+
+    for card in cards.values():
+        card["entries"] = [serialize_auth_log(entry, mac_info) for entry in card["entries"]]
+
+    return {
+        "time_range": time_range,
+        "per_page": per_page,
+        "cards": cards,
     }
 
+def stats_etag(time_range, available_groups, ttl):
+    """Derive the ETag for a stats request from the request args and the current data version.
+
+    The auth_logs version is read at most once per ttl for each set of args,
+    so polling viewers share it instead of querying the database every poll.
+    """
+    groups = [(g['vlan_id'], g['description']) for g in available_groups]
+    # User and vendor edits change the enrichment without touching auth_logs
+    stamps = [shared_cache.get_version(namespace) for namespace in ('users', 'vendors', 'vendor_rows')]
+    args = [request.args.get(name, '') for name in STATS_ARGS]
+    key = hashlib.sha1(json.dumps([args, groups, stamps], default=str).encode('utf-8')).hexdigest()
+
+    def compute():
+        version = get_auth_logs_version(time_range)
+        raw = json.dumps([key, list(version)], default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    return shared_cache.get_or_compute(f"stats_etag:{key}", ttl, compute)
+
 @stats.route('/stats', methods=['GET', 'POST'])
 def stats_page():
     if request.method == 'POST':
@@ -65,73 +176,35 @@ def stats_page():
             per_page=request.form.get('per_page')
         ))
 
-    time_range = request.args.get('time_range', 'last_minute')
-    per_page = int(request.args.get('per_page', 25))
-    page_accept = int(request.args.get('page_accept', 1))
-    page_reject = int(request.args.get('page_reject', 1))
-    page_fallback = int(request.args.get('page_fallback', 1))
-
-    tz_name = current_app.config.get('APP_TIMEZONE', 'UTC')
-    local_tz = pytz.timezone(tz_name)
-
-    def enrich(entry):
-        ts = entry.get('timestamp')
-        if ts:
-            if ts.tzinfo is None:
-                ts = ts.replace(tzinfo=timezone.utc)
-            local_time = ts.astimezone(local_tz)
-            entry['ago'] = humanize.naturaltime(datetime.now(local_tz) - local_time)
-        else:
-            entry['ago'] = 'unknown'
-
-        vendor_info = get_vendor_info(entry['mac_address'], insert_if_found=False)
-        entry['vendor'] = vendor_info['vendor'] if vendor_info else None
+    return render_template("stats.html")
 
-        user = get_user_by_mac(entry['mac_address'])
-        entry['already_exists'] = user is not None
-        entry['existing_vlan'] = user['vlan_id'] if user else None
-        entry['description'] = user['description'] if user else None
-
-        match = re.search(r'VLAN\s+(\d+)', entry.get('result', ''))
-        entry['vlan_id'] = match.group(1) if match else None
-
-        return entry
-
-    total_accept = count_auth_logs('Access-Accept', time_range)
-    total_pages_accept = ceil(total_accept / per_page)
-    offset_accept = (page_accept - 1) * per_page
-    accept_entries = [enrich(e) for e in get_latest_auth_logs('Access-Accept', per_page, time_range, offset_accept)]
-
-    total_reject = count_auth_logs('Access-Reject', time_range)
-    total_pages_reject = ceil(total_reject / per_page)
-    offset_reject = (page_reject - 1) * per_page
-    reject_entries = [enrich(e) for e in get_latest_auth_logs('Access-Reject', per_page, time_range, offset_reject)]
-
-    total_fallback = count_auth_logs('Accept-Fallback', time_range)
-    total_pages_fallback = ceil(total_fallback / per_page)
-    offset_fallback = (page_fallback - 1) * per_page
-    fallback_entries = [enrich(e) for e in get_latest_auth_logs('Accept-Fallback', per_page, time_range, offset_fallback)]
+@stats.route('/fetch_stats_data')
+def fetch_stats_data():
+    """Return stats card data as JSON, answering 304 when the client's ETag is still current.
 
+    The ETag and the data it names are cached in the shared cache for
+    STATS_CACHE_TTL, so all workers and viewers polling the same view share one
+    computation; new log rows show up within that interval.
+    """
+    time_range = request.args.get('time_range', 'last_minute')
+    per_page = min(max(request.args.get('per_page', 25, type=int), 1), MAX_PER_PAGE)
     available_groups = get_all_groups()
+    ttl = current_app.config.get('STATS_CACHE_TTL', 15)
+
+    etag = stats_etag(time_range, available_groups, ttl)
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        data = shared_cache.get_or_compute(f"stats_data:{etag}", ttl,
+                                           lambda: build_stats_data(time_range, per_page))
+        data = dict(data, groups=[
+            {"vlan_id": g['vlan_id'], "description": g['description']} for g in available_groups
+        ])
+        response = jsonify(data)
 
-    return render_template(
-        "stats.html",
-        time_range=time_range,
-        per_page=per_page,
-        accept_entries=accept_entries,
-        reject_entries=reject_entries,
-        fallback_entries=fallback_entries,
-        available_groups=available_groups,
-        page_accept=page_accept,
-        pagination_accept=get_pagination_data(page_accept, total_pages_accept),
-        page_reject=page_reject,
-        pagination_reject=get_pagination_data(page_reject, total_pages_reject),
-        page_fallback=page_fallback,
-        pagination_fallback=get_pagination_data(page_fallback, total_pages_fallback),
-        total_pages_accept=total_pages_accept,
-        total_pages_reject=total_pages_reject,
-        total_pages_fallback=total_pages_fallback
-    )
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @stats.route('/add', methods=['POST'])
 def add():
@@ -145,102 +218,82 @@ def add():
 
 @stats.route('/lookup_mac_async', methods=['POST'])
 def lookup_mac_async():
+    """Resolve vendors for a list of MACs from the IEEE registry and the vendor cache.
+
+    MACs that need the vendor API are handed to a background job instead of
+    being looked up inside the request; the response is then 202 with the
+    job id, and the job's result maps those MACs to their vendors.
+    """
     data = request.get_json()
     macs = data.get('macs', [])
     results = {}
+    pending = []
 
-    rate_limit = int(current_app.config.get("OUI_API_LIMIT_PER_SEC", 2))
-    delay = 1.0 / rate_limit if rate_limit > 0 else 0.5
-
-    prefixes_to_lookup = {}
+    prefixes = {mac: mac.lower().replace(":", "").replace("-", "")[:6] for mac in macs}
+    known_vendors = get_cached_vendors(prefixes.values())
     for mac in macs:
-        prefix = mac.lower().replace(":", "").replace("-", "")[:6]
-        prefixes_to_lookup[prefix] = mac
-
-    known_vendors = get_known_mac_vendors()
-    vendor_cache = {}
-
-    for prefix, mac in prefixes_to_lookup.items():
-        if prefix in known_vendors:
-            results[mac] = known_vendors[prefix]['vendor']
-            continue
-
-        if prefix in vendor_cache:
-            results[mac] = vendor_cache[prefix]
-            continue
-
-        info = get_vendor_info(mac)
-        vendor_name = info.get('vendor', '')
-        vendor_cache[prefix] = vendor_name
-        results[mac] = vendor_name
-
-        sleep(delay)
-
-    return jsonify(results)
-
-@stats.route('/fetch_stats_data')
-def fetch_stats_data():
-    time_range = request.args.get('time_range', 'last_minute')
-    per_page = int(request.args.get('per_page', 25))
-    page_accept = int(request.args.get('page_accept', 1))
-    page_reject = int(request.args.get('page_reject', 1))
-    page_fallback = int(request.args.get('page_fallback', 1))
-
-    tz_name = current_app.config.get('APP_TIMEZONE', 'UTC')
-    local_tz = pytz.timezone(tz_name)
-
-    def enrich(entry):
-        ts = entry.get('timestamp')
-        if ts:
-            if ts.tzinfo is None:
-                ts = ts.replace(tzinfo=timezone.utc)
-            local_time = ts.astimezone(local_tz)
-            entry['ago'] = humanize.naturaltime(datetime.now(local_tz) - local_time)
+        vendor = lookup_oui(mac)
+        if vendor is None and prefixes[mac] in known_vendors:
+            vendor = known_vendors[prefixes[mac]] or VENDOR_NOT_FOUND
+        if vendor is None:
+            pending.append(mac)
         else:
-            entry['ago'] = 'unknown'
-
-        vendor_info = get_vendor_info(entry['mac_address'], insert_if_found=False)
-        entry['vendor'] = vendor_info['vendor'] if vendor_info else None
-
-        user = get_user_by_mac(entry['mac_address'])
-        entry['already_exists'] = user is not None
-        entry['existing_vlan'] = user['vlan_id'] if user else None
-        entry['description'] = user['description'] if user else None
-
-        match = re.search(r'VLAN\s+(\d+)', entry.get('result', ''))
-        entry['vlan_id'] = match.group(1) if match else None
-
-        return entry
-
-    total_accept = count_auth_logs('Access-Accept', time_range)
-    total_pages_accept = ceil(total_accept / per_page)
-    offset_accept = (page_accept - 1) * per_page
-    accept_entries = [enrich(e) for e in get_latest_auth_logs('Access-Accept', per_page, time_range, offset_accept)]
-
-    total_reject = count_auth_logs('Access-Reject', time_range)
-    total_pages_reject = ceil(total_reject / per_page)
-    offset_reject = (page_reject - 1) * per_page
-    reject_entries = [enrich(e) for e in get_latest_auth_logs('Access-Reject', per_page, time_range, offset_reject)]
-
-    total_fallback = count_auth_logs('Accept-Fallback', time_range)
-    total_pages_fallback = ceil(total_fallback / per_page)
-    offset_fallback = (page_fallback - 1) * per_page
-    fallback_entries = [enrich(e) for e in get_latest_auth_logs('Accept-Fallback', per_page, time_range, offset_fallback)]
-
-    available_groups = get_all_groups()
-
-    return render_template(
-        "_stats_cards.html",
-        time_range=time_range,
-        per_page=per_page,
-        page_accept=page_accept,
-        pagination_accept=get_pagination_data(page_accept, total_pages_accept),
-        accept_entries=accept_entries,
-        page_reject=page_reject,
-        pagination_reject=get_pagination_data(page_reject, total_pages_reject),
-        reject_entries=reject_entries,
-        page_fallback=page_fallback,
-        pagination_fallback=get_pagination_data(page_fallback, total_pages_fallback),
-        fallback_entries=fallback_entries,
-        available_groups=available_groups
-    )
\ No newline at end of file
+            results[mac] = vendor
+
+    if not pending:
+        return jsonify(results)
+
+    job_id = enqueue('lookup_macs', {'macs': pending})
+    return jsonify({'results': results, 'pending': pending, 'job_id': job_id,
+                    'status_url': url_for('jobs.job_status', job_id=job_id)}), 202
+
+auth_log_stream = AuthLogBroadcaster(transform=serialize_auth_logs)
+
+def sse_event(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@stats.route('/stream')
+def stream():
+    """Stream new auth_logs rows as Server-Sent Events ('logs' batches, 'resync', heartbeats)."""
+    max_subscribers = current_app.config.get('STATS_STREAM_MAX_SUBSCRIBERS', 4)
+    subscriber = auth_log_stream.subscribe(current_app._get_current_object(), max_subscribers)
+    if subscriber is None:
+        # Keep worker threads for normal requests; the page falls back to polling
+        return jsonify({"error": "Too many live stream subscribers"}), 503
+
+    heartbeat = current_app.config.get('STATS_STREAM_HEARTBEAT', 15)
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+
+    def generate():
+        # Rows up to this id were sent by the backfill; the live queue may repeat them
+        sent_id = 0
+        yield "retry: 5000\n\n"
+        if last_event_id:
+            rows = auth_log_stream.backfill(last_event_id)
+            if len(rows) >= auth_log_stream.batch_size:
+                # The gap is longer than one batch: have the page reload instead
+                sent_id = rows[-1]["id"]
+                yield sse_event({"type": "resync", "id": sent_id, "data": {}})
+            elif rows:
+                sent_id = rows[-1]["id"]
+                yield sse_event({"type": "logs", "id": sent_id, "data": rows})
+        # Hold no pooled connection for the lifetime of the stream
+        release_request_connections()
+        while True:
+            try:
+                event = subscriber.get(timeout=heartbeat)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            if event["type"] == "logs" and event["id"] <= sent_id:
+                continue
+            if event["type"] == "logs" and sent_id:
+                event = dict(event, data=[row for row in event["data"] if row["id"] > sent_id])
+                sent_id = 0
+            yield sse_event(event)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs even if the client goes away before the generator is started
+    response.call_on_close(lambda: auth_log_stream.unsubscribe(subscriber))
+    return response
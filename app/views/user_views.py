@@ -1,22 +1,51 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
 from db_interface import (
-    get_all_users,
+    search_users,
     get_all_groups,
     add_user,
     update_user,
     delete_user,
-    refresh_vendors,
-    get_user_by_mac
+    get_user_by_mac,
+    iter_users_csv
 )
+from jobs import enqueue, job_file_path
 
 user = Blueprint('user', __name__, url_prefix='/user')
 
 
 @user.route('/')
 def user_list():
-    users = get_all_users()
     available_groups = get_all_groups()
-    return render_template('user_list.html', users=users, available_groups=available_groups)
+    return render_template('user_list.html', available_groups=available_groups)
+
+
+@user.route('/data')
+def user_data():
+    """Return one page of users as JSON, filtered and sorted server-side."""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+    page = search_users(
+        mac=request.args.get('mac', '').strip() or None,
+        mac_match=request.args.get('mac_match', 'prefix'),
+        description=request.args.get('description', '').strip() or None,
+        vlan_id=request.args.get('vlan', '').strip() or None,
+        vendor=request.args.get('vendor', '').strip() or None,
+        sort=request.args.get('sort', 'mac'),
+        order=request.args.get('order', 'asc'),
+        cursor=request.args.get('cursor') or None,
+        limit=limit
+    )
+    return jsonify({
+        "users": [
+            {
+                "mac_address": u['mac_address'],
+                "description": u['description'],
+                "vlan_id": u['vlan_id'],
+                "vendor": u['vendor'],
+            }
+            for u in page['users']
+        ],
+        "next_cursor": page['next_cursor']
+    })
 
 
 @user.route('/add', methods=['POST'])
@@ -44,5 +73,28 @@ def delete():
 
 @user.route('/refresh_vendors', methods=['POST'])
 def refresh():
-    refresh_vendors()
-    return {'status': 'OK'}
+    """Queue a background vendor refresh; poll /jobs/<job_id> for its progress."""
+    job_id = enqueue('refresh_vendors', unique=True)
+    return {'status': 'queued', 'job_id': job_id}
+
+
+@user.route('/export')
+def export_users():
+    """Stream all users as CSV without loading the table into memory."""
+    return Response(stream_with_context(iter_users_csv()), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=users.csv'})
+
+
+@user.route('/import', methods=['POST'])
+def import_users():
+    """Import a mac,description,vlan CSV upload in a background job; poll status_url for progress and the summary."""
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({"error": "No file provided"}), 400
+
+    upload = request.files['file']
+    # The job may run in another worker thread or process, so hand it the upload as a file;
+    # local=True keeps it on this host, where the file is
+    path = job_file_path('.csv')
+    upload.save(path)
+    job_id = enqueue('import_users', {'path': path, 'filename': upload.filename}, local=True)
+    return jsonify({'job_id': job_id, 'status_url': url_for('jobs.job_status', job_id=job_id)}), 202
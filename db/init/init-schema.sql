@@ -4,7 +4,9 @@
 CREATE TABLE IF NOT EXISTS users (
     mac_address CHAR(12) NOT NULL PRIMARY KEY CHECK (mac_address REGEXP '^[0-9A-Fa-f]{12}$'),
     description VARCHAR(200),
-    vlan_id VARCHAR(64) NOT NULL
+    vlan_id VARCHAR(64) NOT NULL,
+    INDEX idx_users_vlan_id (vlan_id),
+    INDEX idx_users_description (description)
 );
 
 -- Create auth_logs table
@@ -13,14 +15,18 @@ CREATE TABLE IF NOT EXISTS auth_logs (
     mac_address CHAR(12) NOT NULL CHECK (mac_address REGEXP '^[0-9A-Fa-f]{12}$'),
     reply ENUM('Access-Accept', 'Access-Reject', 'Accept-Fallback') NOT NULL,
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-    result VARCHAR(500) DEFAULT NULL
+    result VARCHAR(500) DEFAULT NULL,
+    INDEX idx_auth_logs_reply_ts (reply, timestamp, id),
+    INDEX idx_auth_logs_ts (timestamp, id)
 );
 
 -- Create mac_vendors table
 CREATE TABLE IF NOT EXISTS mac_vendors (
-    mac_prefix CHAR(6) NOT NULL PRIMARY KEY CHECK (mac_prefix REGEXP '^[0-9A-Fa-f]{6}$'),
+    -- 6, 7 or 9 hex digits: IEEE MA-L (24-bit), MA-M (28-bit) or MA-S (36-bit) assignments
+    mac_prefix VARCHAR(9) NOT NULL PRIMARY KEY CHECK (mac_prefix REGEXP '^[0-9A-Fa-f]{6}([0-9A-Fa-f]|[0-9A-Fa-f]{3})?$'),
     vendor_name VARCHAR(255),
     status ENUM('found', 'not_found') DEFAULT 'found',
+    source ENUM('api', 'ieee') NOT NULL DEFAULT 'api',
     last_checked DATETIME DEFAULT CURRENT_TIMESTAMP,
     last_updated DATETIME DEFAULT CURRENT_TIMESTAMP
 );
@@ -37,3 +43,37 @@ CREATE TABLE IF NOT EXISTS auth_users (
     password_hash VARCHAR(255) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
+
+-- Persisted exact row counts, refreshed on demand from the maintenance page
+CREATE TABLE IF NOT EXISTS table_row_counts (
+    table_name VARCHAR(64) NOT NULL PRIMARY KEY,
+    row_count BIGINT NOT NULL,
+    counted_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- OUI API calls per UTC day, so the daily limit holds across restarts
+CREATE TABLE IF NOT EXISTS oui_api_usage (
+    day DATE NOT NULL PRIMARY KEY,
+    requests INT NOT NULL DEFAULT 0
+);
+
+-- Persistent queue for long-running web actions, claimed by the app's job worker threads
+CREATE TABLE IF NOT EXISTS jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    type VARCHAR(64) NOT NULL,
+    params TEXT,
+    status ENUM('queued', 'running', 'done', 'failed', 'cancelled') NOT NULL DEFAULT 'queued',
+    progress TEXT,
+    result MEDIUMTEXT,
+    error TEXT,
+    cancel_requested TINYINT(1) NOT NULL DEFAULT 0,
+    attempts INT NOT NULL DEFAULT 0,
+    worker VARCHAR(128) DEFAULT NULL,
+    host VARCHAR(255) DEFAULT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME DEFAULT NULL,
+    heartbeat_at DATETIME DEFAULT NULL,
+    finished_at DATETIME DEFAULT NULL,
+    INDEX idx_jobs_status (status, id),
+    INDEX idx_jobs_type_status (type, status)
+);
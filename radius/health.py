@@ -3,6 +3,8 @@ import mysql.connector
 import os
 import socket
 
+from circuit_breaker import read_state_file
+
 app = Flask(__name__)
 
 @app.route('/health', methods=['GET'])
@@ -46,7 +48,11 @@ def health_check():
     status = {
         "status": "healthy" if overall_healthy else "unhealthy",
         "database": db_status,
-        "udp_port": port_status
+        "udp_port": port_status,
+        # Written by main.py; the watchdog alerts when the breaker opens
+        "circuit_breakers": {
+            "database": read_state_file(os.getenv("RADIUS_BREAKER_STATE_FILE", "/tmp/radius_db_breaker.json"))
+        }
     }
     return jsonify(status), 200 if overall_healthy else 503
 
@@ -10,8 +10,22 @@ import logging
 import time
 from pathlib import Path
 
+from circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED
+
 DEFAULT_VLAN_ID = os.getenv("DEFAULT_VLAN", "505")
 DENIED_VLAN = os.getenv("DENIED_VLAN", "999")
+# While the database is unreachable: "drop" sends no reply so the NAS retries or
+# fails over to another RADIUS server, "fallback" accepts everyone on DEFAULT_VLAN
+DB_UNAVAILABLE_ACTION = os.getenv("RADIUS_DB_UNAVAILABLE_ACTION", "drop").lower()
+BREAKER_STATE_FILE = os.getenv("RADIUS_BREAKER_STATE_FILE", "/tmp/radius_db_breaker.json")
+
+# Shared with health.py through BREAKER_STATE_FILE
+db_breaker = CircuitBreaker(
+    "database",
+    failure_threshold=int(os.getenv("DB_BREAKER_FAILURE_THRESHOLD", 5)),
+    reset_timeout=int(os.getenv("DB_BREAKER_RESET_TIMEOUT", 15)),
+    state_file=BREAKER_STATE_FILE,
+)
 
 class MacRadiusServer(Server):
     def __init__(self, *args, **kwargs):
@@ -53,8 +67,14 @@ class MacRadiusServer(Server):
             raise
     
     def get_db_connection(self):
-        """Get a database connection from the pool with improved error handling."""
-        max_retries = 3
+        """Get a database connection from the pool with improved error handling.
+
+        Raises CircuitOpenError without touching the network while the
+        database circuit breaker is open.
+        """
+        db_breaker.before_call()
+        # The half-open probe gets a single attempt, so a dead database reopens the breaker quickly
+        max_retries = 1 if db_breaker.is_probing() else 3
         retry_delay = 2
         
         for attempt in range(max_retries):
@@ -63,13 +83,19 @@ class MacRadiusServer(Server):
                 if connection.is_connected():
                     # Ensure connection is in autocommit mode for consistency
                     connection.autocommit = True
+                    db_breaker.record_success()
                     return connection
                 else:
                     connection.close()
                     raise mysql.connector.Error("Connection not active")
+            except mysql.connector.errors.PoolError:
+                # Pool exhausted: the database itself is fine
+                db_breaker.release_probe()
+                raise
             except mysql.connector.Error as e:
                 logging.warning(f"Database connection attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
+                db_breaker.record_failure(e)
+                if attempt < max_retries - 1 and db_breaker.state == CLOSED:
                     time.sleep(retry_delay)
                     # Try to reset the pool on failure
                     try:
@@ -85,6 +111,20 @@ class MacRadiusServer(Server):
         
         return None
 
+    def HandleDatabaseUnavailable(self, pkt, username, error):
+        """Answer (or not) a request that could not reach the database, per RADIUS_DB_UNAVAILABLE_ACTION."""
+        if DB_UNAVAILABLE_ACTION != "fallback":
+            print(f"🛑 Database unavailable ({error}), dropping request for {username}\n")
+            return
+        print(f"🛑 Database unavailable ({error}), assigning fallback VLAN {DEFAULT_VLAN_ID} to {username} (not logged)")
+        reply = self.CreateReplyPacket(pkt)
+        reply.code = AccessAccept
+        reply["Tunnel-Type"] = 13
+        reply["Tunnel-Medium-Type"] = 6
+        reply["Tunnel-Private-Group-Id"] = DEFAULT_VLAN_ID
+        self.SendReplyPacket(pkt.fd, reply)
+        print("📤 Response sent: Access-Accept\n")
+
     def HandleAuthPacket(self, pkt):
         print(f"\n📡 Received RADIUS Auth Request")
         connection = None
@@ -96,7 +136,11 @@ class MacRadiusServer(Server):
             print(f"→ Attributes: {[f'{k}={v}' for k, v in pkt.items()]}")
 
             # Get connection from pool
-            connection = self.get_db_connection()
+            try:
+                connection = self.get_db_connection()
+            except (CircuitOpenError, mysql.connector.Error) as e:
+                self.HandleDatabaseUnavailable(pkt, username, e)
+                return
             cursor = connection.cursor(dictionary=True)
             now_utc = datetime.now(timezone.utc)
 
@@ -146,6 +190,9 @@ class MacRadiusServer(Server):
         except Exception as e:
             print("❌ Error processing request:")
             traceback.print_exc()
+            if isinstance(e, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError)):
+                # Connection lost mid-query
+                db_breaker.record_failure(e)
             # Rollback on error
             if connection:
                 try:
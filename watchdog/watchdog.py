@@ -28,6 +28,7 @@ class RadMacWatchdog:
         self.config_path = config_path
         self.services = {}
         self.last_status = {}
+        self.breaker_states = {}
         self.restart_attempts = {}
         self.docker_client = None
         
@@ -387,9 +388,32 @@ class RadMacWatchdog:
             logger.debug(f"HTTP recovery attempt failed: {e}")
             return False
 
+    def check_circuit_breakers(self, service_name, health_data, actions):
+        """Alert when a circuit breaker reported in /health opens; log when it closes again."""
+        for breaker_name, breaker in (health_data.get('circuit_breakers') or {}).items():
+            if not breaker:
+                continue
+            key = f"{service_name}:{breaker_name}"
+            state = breaker.get('state')
+            previous = self.breaker_states.get(key)
+            self.breaker_states[key] = state
+            if state == previous:
+                continue
+            if state == 'open':
+                message = (f"{breaker_name} circuit breaker opened after {breaker.get('consecutive_failures')} "
+                           f"failures: {breaker.get('last_error') or 'no details'}")
+                # Restarting the service does not bring its dependency back
+                notify_actions = [action for action in actions if action not in ('restart', 'recover')]
+                self.handle_unhealthy_service(f"{service_name} {breaker_name}", {'status': 'open', 'message': message},
+                                              notify_actions)
+            elif state == 'closed' and previous is not None:
+                logger.info(f"✅ {service_name} {breaker_name} circuit breaker closed")
+
     def handle_status_change(self, service_name, health_response, actions):
         current_healthy = health_response['healthy']
         current_data = health_response.get('data', {})
+        if current_data:
+            self.check_circuit_breakers(service_name, current_data, actions)
         current_status = current_data.get('status', 'healthy' if current_healthy else 'unhealthy')
         
         status_changed = False